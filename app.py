@@ -1,464 +1,2144 @@
+import cProfile
+import gzip
+import hashlib
+import json
 import logging
+import os
+import pstats
+import random
+import re
+import signal
+import sys
+import tempfile
+import threading
 import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import GeneratorType
+from urllib.parse import parse_qs, urlparse
 import requests
-from prometheus_client import start_http_server, Gauge, Summary, Info
+from requests.adapters import HTTPAdapter
+try:
+    import ijson
+except ImportError:
+    ijson = None
+from prometheus_client import generate_latest, CollectorRegistry, Counter, Gauge, Histogram, Summary, Info, REGISTRY
+from prometheus_client.openmetrics.exposition import CONTENT_TYPE_LATEST as OPENMETRICS_CONTENT_TYPE, generate_latest as generate_openmetrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
-# Prometheus metrics definitions
+# Prometheus metrics definitions. Data read from the Wyebot API lives in its own
+# registry so it can be exposed live or as a per-pass snapshot.
+WYEBOT_REGISTRY = CollectorRegistry(auto_describe=True)
+
+# The "info" schema keeps every attribute, including changing numbers, as Info
+# labels. The "numeric" schema exports those numbers as gauges with small label
+# sets and keeps one descriptive _info per entity; only the families of the
+# selected schema are registered.
+METRIC_SCHEMA = os.environ.get('WYEBOT_METRIC_SCHEMA', 'info')
+NUMERIC_METRICS = METRIC_SCHEMA == 'numeric'
+INFO_SCHEMA_REGISTRY = None if NUMERIC_METRICS else WYEBOT_REGISTRY
+NUMERIC_SCHEMA_REGISTRY = WYEBOT_REGISTRY if NUMERIC_METRICS else None
+
+# Label names of each Wyebot data family after the leading org label, which the
+# series tracker fills in; the writers look them up here.
+FAMILY_LABELS = {}
+
+def family(metric_type, name, documentation, labelnames, registry):
+    metric = metric_type(name, documentation, ('org',) + labelnames, registry=registry)
+    FAMILY_LABELS[metric] = labelnames
+    return metric
+
 REQUEST_TIME = Summary('request_processing_seconds', 'Time spent processing request')
-LOCATION_COUNT = Gauge('wyebot_location_count', 'Total number of locations')
-SENSOR_COUNT = Gauge('wyebot_sensor_count', 'Total number of sensors per location', ['location_id', 'location_name'])
-LOCATION_DETAILS = Info('wyebot_location_details', 'Details of locations', ['location_id', 'location_name'])
-SENSOR_DETAILS = Info('wyebot_sensor_details', 'Details of sensors per location', ['location_id', 'location_name', 'sensor_id', 'sensor_name'])
-SENSOR_DATA = Info('wyebot_sensor_data', 'Details of sensor data', ['location_id', 'location_name', 'sensor_id', 'sensor_name', 'model', 'serial_number', 'wireless_mac_address', 'wired_mac_address', 'link_speed', 'power_source', 'uptime', 'software_version', 'license_info'])
-SENSOR_NETWORK_INFO = Info('wyebot_sensor_network_info', 'Network information of sensors', ['location_id', 'location_name', 'sensor_id', 'sensor_name', 'connection_type', 'dhcp', 'ipaddr', 'ip_subnet', 'ip_gateway', 'dns1', 'dns2', 'wireless_network'])
-SENSOR_LLDP_INFO = Info('wyebot_sensor_lldp_info', 'LLDP information of sensors', ['location_id', 'location_name', 'sensor_id', 'sensor_name', 'interface', 'via', 'age', 'vlan_id', 'pvid', 'chassis_capability', 'chassis_mgmt_ip', 'chassis_id', 'chassis_descr', 'port_descr', 'port_id', 'auto_negotiation_current'])
-ACCESS_POINT_DETAILS = Info('wyebot_access_point_details', 'Access point details', ['location_id', 'location_name', 'sensor_id', 'sensor_name', 'mac_address', 'hostname', 'hostname_type_id', 'channel', 'phy_type', 'max_data_rate', 'signal_strength', 'vendor', 'classification_type'])
-CLIENT_DETAILS = Info('wyebot_client_details', 'Client details', ['location_id', 'location_name', 'sensor_id', 'sensor_name', 'mac_address', 'hostname', 'ssid', 'bssid', 'vendor', 'phy_type', 'band_name', 'channel'])
-SSID_DETAILS = Info('wyebot_ssid_details', 'SSID details', ['location_id', 'location_name', 'sensor_id', 'sensor_name', 'ssid', 'total_bssids', 'security_name', 'hidden_ssid', 'bssid', 'hostname', 'hidden_bssid', 'total_clients', 'channel', 'signal_strength'])
-ISSUE_DETAILS = Info('wyebot_issue_details', 'Issue details', ['location_id', 'location_name', 'sensor_id', 'sensor_name', 'severity_name', 'problem', 'problem_description', 'solution'])
-RF_ANALYTICS = Info('wyebot_rf_analytics', 'RF analytics details', ['location_id', 'location_name', 'sensor_id', 'sensor_name', 'radio_id', 'channel', 'airtime_total_percent', 'mgmt_percent', 'ctrl_percent', 'data_percent', 'others_percent', 'available_percent', 'noise', 'client_mac_list', 'client_hostname_list', 'client_airtime_percentage'])
-CLIENT_DISTRIBUTION = Info('wyebot_client_distribution', 'Client distribution details', ['location_id', 'location_name', 'sensor_id', 'sensor_name', 'band', 'total', 'percentage', 'mac_address', 'hostname', 'current_band', 'capability_band', 'category_id', 'vendor', 'ssid'])
-NETWORK_TEST_PROFILES = Info('wyebot_network_test_profiles', 'Network test profiles', ['location_id', 'location_name', 'network_test_profile_id', 'network_test_profile_name', 'network_test_suite_id', 'network_test_suite_name', 'ssid', 'schedule_type_id', 'schedule', 'enabled', 'is_valid'])
-NETWORK_TEST_RESULTS = Info('wyebot_network_test_results', 'Network test results', ['location_id', 'location_name', 'sensor_id', 'sensor_name', 'network_test_profile_id', 'network_test_profile_name', 'network_test_suite_id', 'network_test_suite_name', 'result_status_id', 'result_status_name', 'start_time', 'scheduled_time', 'execution_id'])
-
-# Wyebot API details
-BASE_URL = "https://wip.wyebot.com/external_api"
-API_KEY = "your_api_key_here"
-
-def get_locations():
-    url = f"{BASE_URL}/org/get_locations"
-    headers = {"api_key": API_KEY}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()  # Raise an exception for HTTP errors
-    return response.json()
-
-def get_sensors(location_id):
-    url = f"{BASE_URL}/org/get_sensors"
-    headers = {"api_key": API_KEY}
-    data = {"location_id": location_id}
-    response = requests.post(url, headers=headers, data=data)
-    response.raise_for_status()  # Raise an exception for HTTP errors
-    return response.json()
-
-def get_sensor_info(sensor_id):
-    url = f"{BASE_URL}/org/get_sensor_info"
-    headers = {"api_key": API_KEY}
-    data = {"sensor_id": sensor_id}
-    response = requests.post(url, headers=headers, data=data)
-    response.raise_for_status()  # Raise an exception for HTTP errors
-    return response.json()
-
-def get_sensor_network_info(sensor_id):
-    url = f"{BASE_URL}/org/get_sensor_network_info"
-    headers = {"api_key": API_KEY}
-    data = {"sensor_id": sensor_id}
-    response = requests.post(url, headers=headers, data=data)
-    response.raise_for_status()  # Raise an exception for HTTP errors
-    return response.json()
-
-def get_access_point_details(location_id=None, sensor_id=None):
-    url = f"{BASE_URL}/dashboard/accesspointlist"
-    headers = {"api_key": API_KEY}
-    data = {}
-    if location_id:
-        data["location_id"] = location_id
-    if sensor_id:
-        data["sensor_id"] = sensor_id
-    response = requests.post(url, headers=headers, data=data)
-    response.raise_for_status()  # Raise an exception for HTTP errors
-    return response.json()
+LOCATION_COUNT = family(Gauge, 'wyebot_location_count', 'Total number of locations', (), WYEBOT_REGISTRY)
+SENSOR_COUNT = family(Gauge, 'wyebot_sensor_count', 'Total number of sensors per location', ('location_id', 'location_name'), WYEBOT_REGISTRY)
+LOCATION_DETAILS = family(Info, 'wyebot_location_details', 'Details of locations', ('location_id', 'location_name'), WYEBOT_REGISTRY)
+SENSOR_DETAILS = family(Info, 'wyebot_sensor_details', 'Details of sensors per location', ('location_id', 'location_name', 'sensor_id', 'sensor_name'), WYEBOT_REGISTRY)
+SENSOR_DATA = family(Info, 'wyebot_sensor_data', 'Details of sensor data', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'model', 'serial_number', 'wireless_mac_address', 'wired_mac_address', 'link_speed', 'power_source', 'uptime', 'software_version', 'license_info'), INFO_SCHEMA_REGISTRY)
+SENSOR_NETWORK_INFO = family(Info, 'wyebot_sensor_network_info', 'Network information of sensors', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'connection_type', 'dhcp', 'ipaddr', 'ip_subnet', 'ip_gateway', 'dns1', 'dns2', 'wireless_network'), WYEBOT_REGISTRY)
+SENSOR_LLDP_INFO = family(Info, 'wyebot_sensor_lldp_info', 'LLDP information of sensors', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'interface', 'via', 'age', 'vlan_id', 'pvid', 'chassis_capability', 'chassis_mgmt_ip', 'chassis_id', 'chassis_descr', 'port_descr', 'port_id', 'auto_negotiation_current'), INFO_SCHEMA_REGISTRY)
+ACCESS_POINT_DETAILS = family(Info, 'wyebot_access_point_details', 'Access point details', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'mac_address', 'hostname', 'hostname_type_id', 'channel', 'phy_type', 'max_data_rate', 'signal_strength', 'vendor', 'classification_type'), INFO_SCHEMA_REGISTRY)
+CLIENT_DETAILS = family(Info, 'wyebot_client_details', 'Client details', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'mac_address', 'hostname', 'ssid', 'bssid', 'vendor', 'phy_type', 'band_name', 'channel'), WYEBOT_REGISTRY)
+SSID_DETAILS = family(Info, 'wyebot_ssid_details', 'SSID details', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'ssid', 'total_bssids', 'security_name', 'hidden_ssid', 'bssid', 'hostname', 'hidden_bssid', 'total_clients', 'channel', 'signal_strength'), INFO_SCHEMA_REGISTRY)
+ISSUE_DETAILS = family(Info, 'wyebot_issue_details', 'Issue details', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'severity_name', 'problem', 'problem_description', 'solution'), WYEBOT_REGISTRY)
+RF_ANALYTICS = family(Info, 'wyebot_rf_analytics', 'RF analytics details', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'radio_id', 'channel', 'airtime_total_percent', 'mgmt_percent', 'ctrl_percent', 'data_percent', 'others_percent', 'available_percent', 'noise', 'client_mac_list', 'client_hostname_list', 'client_airtime_percentage'), INFO_SCHEMA_REGISTRY)
+CLIENT_DISTRIBUTION = family(Info, 'wyebot_client_distribution', 'Client distribution details', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'band', 'total', 'percentage', 'mac_address', 'hostname', 'current_band', 'capability_band', 'category_id', 'vendor', 'ssid'), INFO_SCHEMA_REGISTRY)
+NETWORK_TEST_PROFILES = family(Info, 'wyebot_network_test_profiles', 'Network test profiles', ('location_id', 'location_name', 'network_test_profile_id', 'network_test_profile_name', 'network_test_suite_id', 'network_test_suite_name', 'ssid', 'schedule_type_id', 'schedule', 'enabled', 'is_valid'), WYEBOT_REGISTRY)
+NETWORK_TEST_RESULTS = family(Info, 'wyebot_network_test_results', 'Network test results', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'network_test_profile_id', 'network_test_profile_name', 'network_test_suite_id', 'network_test_suite_name', 'result_status_id', 'result_status_name', 'start_time', 'scheduled_time', 'execution_id'), INFO_SCHEMA_REGISTRY)
+NETWORK_TEST_RUNS = family(Counter, 'wyebot_network_test_runs', 'Network test runs reported since the exporter started', ('location_id', 'network_test_profile_id', 'result_status_name'), WYEBOT_REGISTRY)
+NETWORK_TEST_LAST_STATUS = family(Gauge, 'wyebot_network_test_last_result_status', 'result_status_id of the most recent network test run', ('location_id', 'network_test_profile_id', 'sensor_id'), WYEBOT_REGISTRY)
+NETWORK_TEST_LAST_RUN = family(Gauge, 'wyebot_network_test_last_run_timestamp_seconds', 'Start time of the most recent network test run', ('location_id', 'network_test_profile_id', 'sensor_id'), WYEBOT_REGISTRY)
+SENSOR = family(Info, 'wyebot_sensor', 'Descriptive sensor attributes', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'model', 'serial_number', 'wireless_mac_address', 'wired_mac_address', 'link_speed', 'power_source', 'software_version', 'license_info'), NUMERIC_SCHEMA_REGISTRY)
+SENSOR_UPTIME = family(Gauge, 'wyebot_sensor_uptime_seconds', 'Sensor uptime in seconds', ('sensor_id',), NUMERIC_SCHEMA_REGISTRY)
+SENSOR_LLDP_NEIGHBOR = family(Info, 'wyebot_sensor_lldp_neighbor', 'LLDP neighbor of sensors', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'interface', 'via', 'vlan_id', 'pvid', 'chassis_capability', 'chassis_mgmt_ip', 'chassis_id', 'chassis_descr', 'port_descr', 'port_id', 'auto_negotiation_current'), NUMERIC_SCHEMA_REGISTRY)
+SENSOR_LLDP_AGE = family(Gauge, 'wyebot_sensor_lldp_age_seconds', 'Age of the LLDP neighbor entry in seconds', ('sensor_id', 'interface'), NUMERIC_SCHEMA_REGISTRY)
+AP = family(Info, 'wyebot_ap', 'Descriptive access point attributes', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'mac_address', 'hostname', 'hostname_type_id', 'channel', 'phy_type', 'max_data_rate', 'vendor', 'classification_type'), NUMERIC_SCHEMA_REGISTRY)
+AP_SIGNAL = family(Gauge, 'wyebot_ap_signal_dbm', 'Access point signal strength seen by the sensor in dBm', ('sensor_id', 'mac_address'), NUMERIC_SCHEMA_REGISTRY)
+BSSID = family(Info, 'wyebot_bssid', 'Descriptive SSID and BSSID attributes', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'ssid', 'security_name', 'hidden_ssid', 'bssid', 'hostname', 'hidden_bssid', 'channel'), NUMERIC_SCHEMA_REGISTRY)
+SSID_BSSIDS = family(Gauge, 'wyebot_ssid_bssids', 'Number of BSSIDs advertising the SSID', ('sensor_id', 'ssid'), NUMERIC_SCHEMA_REGISTRY)
+SSID_CLIENTS = family(Gauge, 'wyebot_ssid_clients', 'Clients associated to the SSID on the BSSID', ('sensor_id', 'ssid', 'bssid'), NUMERIC_SCHEMA_REGISTRY)
+SSID_SIGNAL = family(Gauge, 'wyebot_ssid_signal_dbm', 'BSSID signal strength seen by the sensor in dBm', ('sensor_id', 'ssid', 'bssid'), NUMERIC_SCHEMA_REGISTRY)
+RF_CHANNEL = family(Gauge, 'wyebot_rf_channel', 'Channel of the sensor radio', ('sensor_id', 'radio'), NUMERIC_SCHEMA_REGISTRY)
+RF_AIRTIME = family(Gauge, 'wyebot_rf_airtime_percent', 'Total airtime utilization of the radio channel', ('sensor_id', 'radio'), NUMERIC_SCHEMA_REGISTRY)
+RF_MGMT = family(Gauge, 'wyebot_rf_mgmt_percent', 'Airtime used by management frames', ('sensor_id', 'radio'), NUMERIC_SCHEMA_REGISTRY)
+RF_CTRL = family(Gauge, 'wyebot_rf_ctrl_percent', 'Airtime used by control frames', ('sensor_id', 'radio'), NUMERIC_SCHEMA_REGISTRY)
+RF_DATA = family(Gauge, 'wyebot_rf_data_percent', 'Airtime used by data frames', ('sensor_id', 'radio'), NUMERIC_SCHEMA_REGISTRY)
+RF_OTHERS = family(Gauge, 'wyebot_rf_others_percent', 'Airtime used by other transmissions', ('sensor_id', 'radio'), NUMERIC_SCHEMA_REGISTRY)
+RF_AVAILABLE = family(Gauge, 'wyebot_rf_available_percent', 'Airtime still available on the channel', ('sensor_id', 'radio'), NUMERIC_SCHEMA_REGISTRY)
+RF_NOISE = family(Gauge, 'wyebot_rf_noise_dbm', 'Noise floor of the radio channel in dBm', ('sensor_id', 'radio'), NUMERIC_SCHEMA_REGISTRY)
+RF_CLIENT_AIRTIME = family(Gauge, 'wyebot_rf_client_airtime_percent', 'Airtime used by clients on the radio', ('sensor_id', 'radio'), NUMERIC_SCHEMA_REGISTRY)
+RF_CLIENTS = family(Gauge, 'wyebot_rf_clients', 'Clients seen on the radio', ('sensor_id', 'radio'), NUMERIC_SCHEMA_REGISTRY)
+CLIENT_BAND = family(Info, 'wyebot_client_band', 'Current and supported bands of clients', ('location_id', 'location_name', 'sensor_id', 'sensor_name', 'mac_address', 'hostname', 'current_band', 'capability_band', 'category_id', 'vendor', 'ssid'), NUMERIC_SCHEMA_REGISTRY)
+CLIENT_BAND_CLIENTS = family(Gauge, 'wyebot_client_band_clients', 'Clients per band', ('sensor_id', 'band'), NUMERIC_SCHEMA_REGISTRY)
+CLIENT_BAND_PERCENT = family(Gauge, 'wyebot_client_band_percent', 'Share of clients per band', ('sensor_id', 'band'), NUMERIC_SCHEMA_REGISTRY)
+API_CALLS_PLANNED = Gauge('wyebot_api_calls_planned', 'Unique API calls planned in the last collection pass')
+API_CALLS_SAVED = Gauge('wyebot_api_calls_deduplicated', 'API calls saved by request deduplication in the last collection pass')
+API_REQUESTS = Counter('wyebot_api_requests', 'Wyebot API calls by endpoint and result', ['org', 'endpoint', 'result'])
+API_REQUEST_DURATION = Histogram('wyebot_api_request_duration_seconds', 'Latency of individual Wyebot API HTTP requests', ['org', 'endpoint'])
+API_RETRIES = Counter('wyebot_api_retries', 'Wyebot API requests retried after an error, timeout, 429 or 5xx', ['org', 'endpoint'])
+API_RATE_LIMIT_WAIT = Counter('wyebot_api_rate_limit_wait_seconds', 'Time API requests waited for the per-organization rate limit', ['org'])
+PROCESSING_ERRORS = Counter('wyebot_processing_errors', 'Errors turning a Wyebot API response into metrics', ['writer'])
+CIRCUITS_OPEN = Gauge('wyebot_api_circuits_open', 'Endpoints or sensors currently skipped by the circuit breaker', ['org', 'scope'])
+CACHE_HITS = Counter('wyebot_cache_hits', 'API responses served from the response cache', ['org', 'endpoint'])
+CACHE_MISSES = Counter('wyebot_cache_misses', 'Cacheable API responses that had to be fetched', ['org', 'endpoint'])
+CACHE_STALE_HITS = Counter('wyebot_cache_stale_hits', 'Expired cached API responses served because a refresh failed', ['org', 'endpoint'])
+CACHE_EVICTIONS = Counter('wyebot_cache_evictions', 'Cached API responses evicted to stay within the cache size', ['org'])
+CACHE_ENTRIES = Gauge('wyebot_cache_entries', 'API responses currently held in the response cache', ['org'])
+SERIES_LIVE = Gauge('wyebot_series_live', 'Label sets currently exported per Wyebot metric family', ['family'])
+SERIES_EVICTED = Counter('wyebot_series_evicted', 'Label sets removed after going unseen for too many passes', ['family'])
+SERIES_WRITES = Counter('wyebot_series_writes', 'Label set writes made by the metric writers')
+WRITE_SECONDS = Counter('wyebot_write_seconds', 'Time spent turning API responses into metrics')
+CALL_PHASE_DURATION = Histogram('wyebot_call_phase_duration_seconds', 'Time an API call spent fetching, decoding JSON and writing metrics', ['phase', 'endpoint'], buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+PASS_PHASE_DURATION = Histogram('wyebot_pass_phase_duration_seconds', 'Time spent in each phase of a collection pass', ['phase'], buckets=(.01, .1, .5, 1, 2.5, 5, 10, 30, 60, 120))
+LOCATION_PASS_DURATION = family(Gauge, 'wyebot_location_pass_duration_seconds', 'Time from the first API call of a location starting to its last one finishing in the last pass', ('location_id',), REGISTRY)
+PASS_API_CALLS = Gauge('wyebot_pass_api_calls', 'API calls of the last collection pass by outcome', ['result'])
+API_RESPONSE_BYTES = Counter('wyebot_api_response_bytes', 'Bytes of Wyebot API response bodies received, after decompression', ['org', 'endpoint'])
+API_IN_FLIGHT = Gauge('wyebot_api_requests_in_flight', 'Wyebot API HTTP requests currently waiting for a response', ['org'])
+SENSOR_LAST_UPDATE = Gauge('wyebot_sensor_last_update_timestamp_seconds', 'Unix time a response for the sensor was last written without errors', ['org', 'location_id', 'sensor_id'])
+SNAPSHOT_TIMESTAMP = Gauge('wyebot_snapshot_timestamp_seconds', 'Unix time the exposed Wyebot metrics snapshot was taken')
+SCHEDULE_INTERVAL = Gauge('wyebot_schedule_interval_seconds', 'Current polling interval per endpoint, including adaptive backoff', ['org', 'endpoint'])
+SCHEDULE_LAG = Histogram('wyebot_schedule_lag_seconds', 'How long after its scheduled time an API call was made', ['org', 'endpoint'], buckets=(1, 5, 10, 30, 60, 120, 300, 900, 1800))
+SCHEDULE_PASS_LAG = Gauge('wyebot_schedule_pass_lag_seconds', 'How late the last collection pass started relative to its tick')
+SCHEDULE_OVERRUNS = Counter('wyebot_schedule_overruns', 'Scheduler ticks skipped because the previous pass was still running')
+SHARD_LAST_SUCCESS = Gauge('wyebot_shard_last_success_timestamp_seconds', 'Unix time this shard last completed a pass within the deadline', ['shard_index', 'shard_count'])
 
-def get_client_details(location_id=None, sensor_id=None):
-    url = f"{BASE_URL}/dashboard/clientlist"
-    headers = {"api_key": API_KEY}
-    data = {}
-    if location_id:
-        data["location_id"] = location_id
-    if sensor_id:
-        data["sensor_id"] = sensor_id
-    response = requests.post(url, headers=headers, data=data)
-    response.raise_for_status()  # Raise an exception for HTTP errors
-    return response.json()
+# Wyebot API details. WYEBOT_ORGS_FILE lists several organizations to collect
+# in one process; without it the organization below is the only one.
+BASE_URL = os.environ.get('WYEBOT_BASE_URL', "https://wip.wyebot.com/external_api")
+API_KEY = os.environ.get('WYEBOT_API_KEY', "your_api_key_here")
+ORG_NAME = os.environ.get('WYEBOT_ORG', 'default')
+ORGS_FILE = os.environ.get('WYEBOT_ORGS_FILE', '')
+RATE_LIMIT = float(os.environ.get('WYEBOT_RATE_LIMIT', '0'))
 
-def get_ssid_details(location_id=None, sensor_id=None):
-    url = f"{BASE_URL}/dashboard/ssidlist"
-    headers = {"api_key": API_KEY}
-    data = {}
-    if location_id:
-        data["location_id"] = location_id
-    if sensor_id:
-        data["sensor_id"] = sensor_id
-    response = requests.post(url, headers=headers, data=data)
-    response.raise_for_status()  # Raise an exception for HTTP errors
-    return response.json()
-
-def get_issue_details(sensor_id):
-    url = f"{BASE_URL}/dashboard/sensor_issues"
-    headers = {"api_key": API_KEY}
-    data = {"sensor_id": sensor_id}
-    response = requests.post(url, headers=headers, data=data)
-    response.raise_for_status()  # Raise an exception for HTTP errors
-    return response.json()
-
-def get_rf_analytics(location_id=None, sensor_id=None):
-    url = f"{BASE_URL}/dashboard/rf_analytics"
-    headers = {"api_key": API_KEY}
-    data = {}
-    if location_id:
-        data["location_id"] = location_id
-    if sensor_id:
-        data["sensor_id"] = sensor_id
-    response = requests.post(url, headers=headers, data=data)
-    response.raise_for_status()  # Raise an exception for HTTP errors
-    return response.json()
+# Collection engine settings
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('WYEBOT_MAX_CONCURRENT_REQUESTS', '16'))
+MAX_REQUESTS_PER_LOCATION = int(os.environ.get('WYEBOT_MAX_REQUESTS_PER_LOCATION', '4'))
+PASS_DEADLINE_SECONDS = float(os.environ.get('WYEBOT_PASS_DEADLINE_SECONDS', '55'))
+BULK_FETCH = os.environ.get('WYEBOT_BULK_FETCH', 'false').lower() in ('1', 'true', 'yes')
+BULK_REPROBE_SECONDS = float(os.environ.get('WYEBOT_BULK_REPROBE_SECONDS', '3600'))
+SNAPSHOT_METRICS = os.environ.get('WYEBOT_SNAPSHOT_METRICS', 'false').lower() in ('1', 'true', 'yes')
+STALE_AFTER_PASSES = int(os.environ.get('WYEBOT_STALE_AFTER_PASSES', '3'))
+
+# HTTP client settings
+HTTP_POOL_SIZE = int(os.environ.get('WYEBOT_HTTP_POOL_SIZE', MAX_CONCURRENT_REQUESTS))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('WYEBOT_HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.environ.get('WYEBOT_HTTP_READ_TIMEOUT', '30'))
+HTTP_MAX_RETRIES = int(os.environ.get('WYEBOT_HTTP_MAX_RETRIES', '3'))
+HTTP_BACKOFF_SECONDS = float(os.environ.get('WYEBOT_HTTP_BACKOFF_SECONDS', '0.5'))
+HTTP_BACKOFF_MAX_SECONDS = float(os.environ.get('WYEBOT_HTTP_BACKOFF_MAX_SECONDS', '30'))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Errors that mean a call's response couldn't be read or decoded.
+RESPONSE_ERRORS = (requests.RequestException, ValueError) + ((ijson.JSONError,) if ijson else ())
+
+# Response cache settings. Slow-changing endpoints are served from the cache
+# until their TTL expires; endpoints without a TTL are always fetched.
+# Endpoints that are also on the polling schedule keep a TTL below their
+# interval, so every slot that comes due fetches fresh data and the cache only
+# serves stale responses on errors and warm restarts.
+CACHE_TTLS = {
+    '/org/get_locations': 300,
+    '/org/get_sensors': 300,
+    '/org/get_sensor_info': 900,
+    '/org/get_sensor_network_info': 900,
+    '/test/get_network_test_profiles': 1800,
+}
+for override in filter(None, os.environ.get('WYEBOT_CACHE_TTLS', '').split(',')):
+    cache_endpoint, cache_ttl = override.split('=')
+    CACHE_TTLS[cache_endpoint.strip()] = float(cache_ttl)
+CACHE_MAX_ENTRIES = int(os.environ.get('WYEBOT_CACHE_MAX_ENTRIES', '10000'))
+CACHE_STALE_IF_ERROR_SECONDS = float(os.environ.get('WYEBOT_CACHE_STALE_IF_ERROR_SECONDS', '3600'))
+CACHE_FILE = os.environ.get('WYEBOT_CACHE_FILE', '')
+
+# Network test results are fetched incrementally from a per-profile high-water
+# mark; the first pass looks back this far.
+TEST_RESULTS_LOOKBACK_SECONDS = float(os.environ.get('WYEBOT_TEST_RESULTS_LOOKBACK_SECONDS', '3600'))
+TEST_RESULTS_STATE_FILE = os.environ.get('WYEBOT_TEST_RESULTS_STATE_FILE', '')
+TEST_RESULTS_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Sharding settings. Each replica collects the locations that hash to its
+# shard; in a StatefulSet the index defaults to the pod's ordinal.
+SHARD_COUNT = int(os.environ.get('WYEBOT_SHARD_COUNT', '1'))
+SHARD_INDEX = os.environ.get('WYEBOT_SHARD_INDEX')
+if SHARD_INDEX is None:
+    hostname_ordinal = re.search(r'-(\d+)$', os.environ.get('HOSTNAME', ''))
+    SHARD_INDEX = hostname_ordinal.group(1) if hostname_ordinal and SHARD_COUNT > 1 else '0'
+SHARD_INDEX = int(SHARD_INDEX)
+if not 0 <= SHARD_INDEX < SHARD_COUNT:
+    raise ValueError(f"WYEBOT_SHARD_INDEX must be between 0 and {SHARD_COUNT - 1}, got {SHARD_INDEX}")
+
+# Polling schedule. Every tick runs a pass that makes only the calls whose
+# endpoint interval has come round for that sensor, location or profile;
+# endpoints without an interval (or with 0) are called on every tick.
+SCHEDULE_TICK_SECONDS = float(os.environ.get('WYEBOT_SCHEDULE_TICK_SECONDS', '10'))
+SCHEDULE_INTERVALS = {
+    '/dashboard/rf_analytics': 30,
+    '/dashboard/clientlist': 30,
+    '/dashboard/clientdistributionlist': 30,
+    '/dashboard/accesspointlist': 60,
+    '/dashboard/ssidlist': 60,
+    '/dashboard/sensor_issues': 120,
+    '/test/get_network_test_results': 60,
+    '/org/get_sensor_info': 1800,
+    '/org/get_sensor_network_info': 1800,
+}
+for override in filter(None, os.environ.get('WYEBOT_SCHEDULE_INTERVALS', '').split(',')):
+    schedule_endpoint, schedule_interval = override.split('=')
+    SCHEDULE_INTERVALS[schedule_endpoint.strip()] = float(schedule_interval)
+SCHEDULE_MAX_BACKOFF = float(os.environ.get('WYEBOT_SCHEDULE_MAX_BACKOFF', '8'))
+SCHEDULE_LATENCY_FACTOR = float(os.environ.get('WYEBOT_SCHEDULE_LATENCY_FACTOR', '2'))
+
+# Streaming parser settings. Large dashboard responses are parsed incrementally
+# with ijson and only the fields the writers use are kept.
+STREAM_PARSING = os.environ.get('WYEBOT_STREAM_PARSING', 'false').lower() in ('1', 'true', 'yes')
+STREAM_CHUNK_SIZE = 64 * 1024
+if STREAM_PARSING and ijson is None:
+    logging.warning("WYEBOT_STREAM_PARSING is set but ijson is not installed; parsing whole responses instead")
+    STREAM_PARSING = False
+
+# Fields kept per endpoint when streaming: the object holding the row lists, and
+# for each list the row fields (a (name, fields) pair projects a nested list).
+STREAM_PROJECTIONS = {
+    '/dashboard/accesspointlist': ('access_point_details', {
+        'data': ('sensor_id', 'mac_address', 'hostname', 'hostname_type_id', 'channel', 'phy_type', 'max_data_rate', 'signal_strength', 'vendor', 'classification_type'),
+    }),
+    '/dashboard/clientlist': ('client_details', {
+        'data': ('sensor_id', 'mac_address', 'hostname', 'ssid', 'bssid', 'vendor', 'phy_type', 'band_name', 'channel'),
+    }),
+    '/dashboard/ssidlist': ('ssid_details', {
+        'data': ('sensor_id', 'ssid', 'total_bssids', 'security_name', 'hidden_ssid',
+                 ('bssid_details_array', ('bssid', 'hostname', 'hidden_bssid', 'total_clients', 'channel', 'signal_strength'))),
+    }),
+    '/dashboard/sensor_issues': ('issue_details', {
+        'data': ('severity_name', 'problem', 'problem_description', 'solution'),
+    }),
+    '/dashboard/clientdistributionlist': ('client_distribution_list', {
+        'band_usage_array': ('band', 'total', 'percentage'),
+        'data': ('mac_address', 'hostname', 'current_band', 'capability_band', 'category_id', 'vendor', 'ssid'),
+    }),
+}
+
+# Profiling. SIGUSR1 writes a cProfile of the next collection pass and SIGUSR2
+# a tracemalloc snapshot of it to this directory.
+PROFILE_DIR = os.environ.get('WYEBOT_PROFILE_DIR', tempfile.gettempdir())
+TRACEMALLOC_FRAMES = int(os.environ.get('WYEBOT_TRACEMALLOC_FRAMES', '10'))
+
+# /metrics server settings. The default registry is rendered once per pass and
+# every scrape until the next pass is served from those bytes.
+METRICS_PORT = 8000
+TEXT_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+EXPOSITION_GZIP_LEVEL = int(os.environ.get('WYEBOT_EXPOSITION_GZIP_LEVEL', '6'))
+
+# Circuit breaker settings
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('WYEBOT_BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get('WYEBOT_BREAKER_COOLDOWN_SECONDS', '300'))
+
+EXECUTOR = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix='wyebot-collector')
+# Calls on the executor per organization and per (organization, location).
+# They outlive a plan: a call still running at the deadline keeps its slot
+# until it returns, so the next pass doesn't stack more work on top of it.
+RUNNING_CALLS = threading.Condition()
+RUNNING_BY_ORG = {}
+RUNNING_BY_LOCATION = {}
+
+class WyebotCollector:
+    # Exposes WYEBOT_REGISTRY either live or, in snapshot mode, as the immutable
+    # metric families of the last completed pass. refresh() swaps the snapshot in
+    # with a single assignment, so a scrape never blocks on the API or sees a
+    # half-written pass.
+    def __init__(self, registry, snapshot=False):
+        self.registry = registry
+        self.snapshot = snapshot
+        self.families = ()
+
+    def refresh(self):
+        if self.snapshot:
+            self.families = tuple(self.registry.collect())
+            SNAPSHOT_TIMESTAMP.set_to_current_time()
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        if self.snapshot:
+            return self.families
+        return self.registry.collect()
+
+# The Wyebot families are rendered once per pass for /metrics (see
+# MetricsExposition), so the collector is not part of the live default registry.
+COLLECTOR = WyebotCollector(WYEBOT_REGISTRY, snapshot=SNAPSHOT_METRICS)
+
+class Families:
+    # A fixed list of metric families that the exposition encoders can render.
+    def __init__(self, families):
+        self.families = families
+
+    def collect(self):
+        return self.families
+
+def exposition_etag(body):
+    return f'W/"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+class Rendering:
+    # The Wyebot families rendered in one format: the body, a gzipped copy, its
+    # ETag and the byte range of every family, so name[] filters are answered
+    # by slicing the body instead of rendering again.
+    def __init__(self, families, openmetrics=False):
+        self.openmetrics = openmetrics
+        self.content_type = OPENMETRICS_CONTENT_TYPE if openmetrics else TEXT_CONTENT_TYPE
+        # OpenMetrics ends with a single "# EOF" line, so it is cut off every
+        # family and added once at the end.
+        self.trailer = b'# EOF\n' if openmetrics else b''
+        encoder = generate_openmetrics if openmetrics else generate_latest
+        chunks = []
+        self.ranges = {}
+        self.names = {}
+        offset = 0
+        for family in families:
+            chunk = encoder(Families([family]))
+            if openmetrics and chunk.endswith(self.trailer):
+                chunk = chunk[:-len(self.trailer)]
+            chunks.append(chunk)
+            self.ranges[family.name] = (offset, offset + len(chunk))
+            offset += len(chunk)
+            # A family can be asked for by its own name or any of its sample names.
+            self.names[family.name] = family.name
+            for sample in family.samples:
+                self.names[sample.name] = family.name
+        chunks.append(self.trailer)
+        self.body = b''.join(chunks)
+        self.gzipped = gzip.compress(self.body, compresslevel=EXPOSITION_GZIP_LEVEL)
+        self.etag = exposition_etag(self.body)
+
+    def select(self, names):
+        families = {self.names[name] for name in names if name in self.names}
+        return b''.join([self.body[start:end] for family, (start, end) in self.ranges.items() if family in families] + [self.trailer])
+
+class MetricsExposition:
+    # Builds the /metrics payload. The Wyebot families only change during a
+    # pass, so refresh() re-renders them at the end of every pass, in the
+    # formats that were scraped since the previous pass, and swaps them in with
+    # a single assignment; a format asked for the first time is rendered by
+    # that scrape and kept until the next pass. The exporter's own metrics are
+    # small and change between passes (requests in flight, process metrics),
+    # so they are rendered live on every scrape and put in front.
+    def __init__(self, collector, registry):
+        self.collector = collector
+        self.registry = registry
+        self.renderings = {}
+        self.requested = {False}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        with self.lock:
+            formats, self.requested = self.requested, set()
+        if not formats:
+            self.renderings = {}
+            return
+        families = list(self.collector.collect())
+        self.renderings = {openmetrics: Rendering(families, openmetrics) for openmetrics in formats}
+
+    def get(self, openmetrics):
+        with self.lock:
+            self.requested.add(openmetrics)
+            rendering = self.renderings.get(openmetrics)
+            if rendering is None:
+                rendering = Rendering(list(self.collector.collect()), openmetrics)
+                self.renderings = {**self.renderings, openmetrics: rendering}
+            return rendering
+
+    def render(self, openmetrics, names=None):
+        # Returns the content type, body, ETag and, when the body is unfiltered,
+        # its gzipped form. gzip members can be concatenated, so only the live
+        # part is compressed per scrape.
+        rendering = self.get(openmetrics)
+        registry = self.registry.restricted_registry(names) if names else self.registry
+        live = (generate_openmetrics if openmetrics else generate_latest)(registry)
+        if openmetrics and live.endswith(rendering.trailer):
+            live = live[:-len(rendering.trailer)]
+        if names:
+            body = live + rendering.select(names)
+            return rendering.content_type, body, exposition_etag(body), None
+        body = live + rendering.body
+        gzipped = gzip.compress(live, compresslevel=EXPOSITION_GZIP_LEVEL) + rendering.gzipped
+        return rendering.content_type, body, exposition_etag(live + rendering.etag.encode()), gzipped
+
+EXPOSITION = MetricsExposition(COLLECTOR, REGISTRY)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    # Serves the exposition, gzipped when the client accepts it, with an ETag so
+    # unchanged payloads are answered with 304 Not Modified.
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/favicon.ico':
+            self.send_error(404)
+            return
+        accept = [value.split(';')[0].strip() for value in self.headers.get('Accept', '').split(',')]
+        names = parse_qs(url.query).get('name[]')
+        content_type, body, etag, gzipped = EXPOSITION.render('application/openmetrics-text' in accept, names)
+        
+        if_none_match = [value.strip() for value in self.headers.get('If-None-Match', '').split(',')]
+        if etag in if_none_match or '*' in if_none_match:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        
+        self.send_response(200)
+        accept_encoding = [value.split(';')[0].strip().lower() for value in self.headers.get('Accept-Encoding', '').split(',')]
+        if 'gzip' in accept_encoding:
+            body = gzipped or gzip.compress(body, compresslevel=EXPOSITION_GZIP_LEVEL)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Vary', 'Accept, Accept-Encoding')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are too frequent to log.
+        pass
+
+def start_metrics_server(port):
+    server = ThreadingHTTPServer(('', port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+class SeriesTracker:
+    # Remembers the pass in which every label set was last written so series for
+    # roaming clients, cleared issues or changed channels don't live forever.
+    # Writers for endpoints polled less often than every pass set context.max_age
+    # so their series also survive until they have missed that many polls. The
+    # child handle of every label set is kept too, so rewriting a series skips
+    # prometheus_client's label validation and lookup. Writers leave out the org
+    # label; it is taken from context.org, which is set for the organization
+    # whose response is being written.
+    def __init__(self, stale_after):
+        self.stale_after = stale_after
+        self.generation = 0
+        self.last_seen = {}
+        self.context = threading.local()
+        self.lock = threading.Lock()
+
+    def children(self, metric, rows, info=False):
+        # Returns the child for every tuple of label values in rows, creating the
+        # missing ones, under a single acquisition of the lock. Info children
+        # always carry an empty value, so it is only set when one is created.
+        expires = time.time() + getattr(self.context, 'max_age', 0)
+        org = (self.context.org,)
+        children = []
+        with self.lock:
+            series = self.last_seen.get(metric)
+            if series is None:
+                series = self.last_seen[metric] = {}
+            for labelvalues in rows:
+                labelvalues = org + labelvalues
+                entry = series.get(labelvalues)
+                if entry is None:
+                    child = metric.labels(*labelvalues)
+                    if info:
+                        child.info({})
+                    series[labelvalues] = [self.generation, expires, child]
+                else:
+                    entry[0] = self.generation
+                    entry[1] = expires
+                    child = entry[2]
+                children.append(child)
+        SERIES_WRITES.inc(len(children))
+        return children
+
+    def end_pass(self):
+        now = time.time()
+        with self.lock:
+            self.generation += 1
+            for metric, series in self.last_seen.items():
+                family = metric.describe()[0].name
+                stale = [labelvalues for labelvalues, (seen, expires, _) in series.items() if self.generation - seen > self.stale_after and now > expires]
+                for labelvalues in stale:
+                    metric.remove(*labelvalues)
+                    del series[labelvalues]
+                if stale:
+                    SERIES_EVICTED.labels(family=family).inc(len(stale))
+                SERIES_LIVE.labels(family=family).set(len(series))
+
+SERIES = SeriesTracker(STALE_AFTER_PASSES)
+
+class SensorUpdates:
+    # Records when each sensor last had a response written without errors.
+    # Unlike the data series these are kept while a sensor keeps failing, and are
+    # only dropped once the sensor or its location is no longer listed.
+    def __init__(self, metric):
+        self.metric = metric
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def mark(self, org, location_id, sensor_id):
+        key = (org, str(location_id), str(sensor_id))
+        with self.lock:
+            child = self.children.get(key)
+            if child is None:
+                child = self.children[key] = self.metric.labels(*key)
+        child.set_to_current_time()
+
+    def prune(self, org, location_ids, sensors_by_location):
+        # Sensors of locations whose sensor list couldn't be fetched are kept.
+        location_ids = {str(location_id) for location_id in location_ids}
+        listed = {str(location_id) for location_id in sensors_by_location}
+        sensors = {(str(location_id), str(sensor['sensor_id'])) for location_id, location_sensors in sensors_by_location.items() for sensor in location_sensors}
+        with self.lock:
+            for key in list(self.children):
+                if key[0] == org and (key[1] not in location_ids or (key[1] in listed and key[1:] not in sensors)):
+                    self.metric.remove(*key)
+                    del self.children[key]
+
+SENSOR_UPDATES = SensorUpdates(SENSOR_LAST_UPDATE)
+
+class LastTestResults:
+    # Status and start time of the most recent run per (location, profile,
+    # sensor). A run is only reported once, so these gauges are kept out of the
+    # series tracker and are only dropped once the profile or its location is no
+    # longer listed.
+    def __init__(self, status_metric, run_metric):
+        self.status_metric = status_metric
+        self.run_metric = run_metric
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def set(self, org, location_id, network_test_profile_id, sensor_id, status, start_time):
+        key = (org, str(location_id), str(network_test_profile_id), str(sensor_id))
+        with self.lock:
+            children = self.children.get(key)
+            if children is None:
+                children = self.children[key] = (self.status_metric.labels(*key), self.run_metric.labels(*key))
+        if status is not None:
+            children[0].set(status)
+        if start_time is not None:
+            children[1].set(start_time)
+
+    def prune(self, org, location_ids, profiles_by_location):
+        # Profiles of locations whose profile list couldn't be fetched are kept.
+        location_ids = {str(location_id) for location_id in location_ids}
+        listed = {str(location_id) for location_id in profiles_by_location}
+        profiles = {(str(location_id), str(profile.get('network_test_profile_id'))) for location_id, location_profiles in profiles_by_location.items() for profile in location_profiles}
+        with self.lock:
+            for key in list(self.children):
+                if key[0] == org and (key[1] not in location_ids or (key[1] in listed and key[1:3] not in profiles)):
+                    self.status_metric.remove(*key)
+                    self.run_metric.remove(*key)
+                    del self.children[key]
+
+LAST_TEST_RESULTS = LastTestResults(NETWORK_TEST_LAST_STATUS, NETWORK_TEST_LAST_RUN)
+
+class PassProfiler:
+    # Profiles one collection pass on request. A CPU profile covers the main
+    # thread and every API call run by the collector threads; a memory profile
+    # is a tracemalloc snapshot of what the pass allocated and still holds.
+    # From Python 3.12 cProfile is built on sys.monitoring, which sees every
+    # thread but allows only one active profiler; before that, each collector
+    # thread needs a profiler of its own.
+    def __init__(self, directory, frames=TRACEMALLOC_FRAMES):
+        self.directory = directory
+        self.frames = frames
+        self.per_thread = sys.version_info < (3, 12)
+        self.requested = set()
+        self.active = set()
+        self.profiles = []
+        self.lock = threading.Lock()
+
+    def handle_signal(self, signum, frame):
+        # Only records the request; signal handlers must not take the logging lock.
+        self.requested.add('cpu' if signum == signal.SIGUSR1 else 'memory')
+
+    def start(self):
+        self.active, self.requested = self.requested, set()
+        if 'memory' in self.active:
+            logging.info("Tracing memory allocations of this collection pass")
+            tracemalloc.start(self.frames)
+        if 'cpu' in self.active:
+            logging.info("Profiling this collection pass")
+            self.profiles = [cProfile.Profile()]
+            self.profiles[0].enable()
+
+    def wrap(self, func):
+        if 'cpu' not in self.active or not self.per_thread:
+            return func
+        def profiled(*args):
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(func, *args)
+            finally:
+                with self.lock:
+                    if 'cpu' in self.active:
+                        self.profiles.append(profile)
+        return profiled
+
+    def stop(self):
+        if not self.active:
+            return
+        with self.lock:
+            active, self.active = self.active, set()
+            profiles, self.profiles = self.profiles, []
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        try:
+            if 'cpu' in active:
+                profiles[0].disable()
+                stats = pstats.Stats(profiles[0])
+                for profile in profiles[1:]:
+                    stats.add(profile)
+                path = os.path.join(self.directory, f"wyebot-pass-{stamp}.prof")
+                stats.dump_stats(path)
+                logging.info(f"Wrote CPU profile of the collection pass to {path}")
+            if 'memory' in active:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                path = os.path.join(self.directory, f"wyebot-pass-{stamp}.tracemalloc")
+                snapshot.dump(path)
+                logging.info(f"Wrote memory snapshot of the collection pass to {path}; largest allocations:")
+                for stat in snapshot.statistics('lineno')[:10]:
+                    logging.info(f"  {stat}")
+        except OSError as e:
+            logging.warning(f"Could not write profile of the collection pass: {e}")
+
+PROFILER = PassProfiler(PROFILE_DIR)
+
+class ResponseCache:
+    def __init__(self, org, ttls, max_entries=CACHE_MAX_ENTRIES, stale_if_error=CACHE_STALE_IF_ERROR_SECONDS, path=CACHE_FILE):
+        self.org = org
+        self.ttls = {endpoint: ttl for endpoint, ttl in ttls.items() if ttl > 0}
+        self.max_entries = max_entries
+        self.stale_if_error = stale_if_error
+        self.path = path
+        self.entries = OrderedDict()
+        # Set by put() so a pass that only served cache hits doesn't rewrite the file.
+        self.changed = False
+        self.lock = threading.Lock()
+
+    def key(self, endpoint, params):
+        return (endpoint, tuple(sorted((name, str(value)) for name, value in (params or {}).items())))
+
+    def cacheable(self, endpoint):
+        return endpoint in self.ttls
+
+    def lookup(self, key, max_age):
+        # Entries carry their own fetch time, so each one goes stale on its own
+        # schedule; lookups refresh its LRU position.
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.time() - entry[0] > max_age:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def get(self, key):
+        return self.lookup(key, self.ttls[key[0]])
+
+    def get_stale(self, key):
+        return self.lookup(key, self.ttls[key[0]] + self.stale_if_error)
+
+    def put(self, key, response, fetched_at=None):
+        with self.lock:
+            self.entries[key] = (fetched_at or time.time(), response)
+            self.entries.move_to_end(key)
+            self.changed = True
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                CACHE_EVICTIONS.labels(org=self.org).inc()
+            CACHE_ENTRIES.labels(org=self.org).set(len(self.entries))
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+            # A file of the wrong shape is ignored like an unreadable one.
+            entries = [(endpoint, tuple((str(name), str(value)) for name, value in params), float(fetched_at), response)
+                       for endpoint, params, fetched_at, response in entries]
+            if not all(isinstance(endpoint, str) for endpoint, _, _, _ in entries):
+                raise ValueError("endpoints must be strings")
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable cache file {self.path}: {e}")
+            return
+        now = time.time()
+        loaded = 0
+        for endpoint, params, fetched_at, response in entries:
+            if self.cacheable(endpoint) and now - fetched_at <= self.ttls[endpoint] + self.stale_if_error:
+                self.put((endpoint, params), response, fetched_at)
+                loaded += 1
+        self.changed = False
+        logging.info(f"Loaded {loaded} cached API responses from {self.path}")
+
+    def save(self):
+        if not self.path or not self.changed:
+            return
+        with self.lock:
+            entries = [[key[0], key[1], fetched_at, response] for key, (fetched_at, response) in self.entries.items()]
+            self.changed = False
+        # Write to a temporary file first so a crash never leaves a truncated cache.
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.changed = True
+            logging.warning(f"Could not write cache file {self.path}: {e}")
+
+class TestResultWatermarks:
+    # Keeps the newest start_time seen per (location, profile), together with the
+    # execution_ids reported at that instant, so each pass only asks for and
+    # processes results that arrived since the last one.
+    def __init__(self, lookback=TEST_RESULTS_LOOKBACK_SECONDS, path=TEST_RESULTS_STATE_FILE):
+        self.lookback = lookback
+        self.path = path
+        self.marks = {}
+        self.changed = False
+        self.lock = threading.Lock()
+
+    def key(self, location_id, network_test_profile_id):
+        return f"{location_id}:{network_test_profile_id}"
+
+    def window(self, location_id, network_test_profile_id, now):
+        with self.lock:
+            mark = self.marks.get(self.key(location_id, network_test_profile_id))
+        if mark:
+            start_time = mark['start_time']
+        else:
+            start_time = (now - timedelta(seconds=self.lookback)).strftime(TEST_RESULTS_TIME_FORMAT)
+        return start_time, now.strftime(TEST_RESULTS_TIME_FORMAT)
+
+    def new_results(self, location_id, network_test_profile_id, results):
+        key = self.key(location_id, network_test_profile_id)
+        with self.lock:
+            mark = self.marks.get(key, {'start_time': '', 'execution_ids': []})
+            seen = set(mark['execution_ids'])
+            new = sorted(
+                (result for result in results
+                 if str(result.get('start_time', '')) > mark['start_time']
+                 or (str(result.get('start_time', '')) == mark['start_time'] and str(result.get('execution_id', '')) not in seen)),
+                key=lambda result: str(result.get('start_time', '')))
+            if new:
+                latest = str(new[-1].get('start_time', ''))
+                execution_ids = {str(result.get('execution_id', '')) for result in new if str(result.get('start_time', '')) == latest}
+                if latest == mark['start_time']:
+                    execution_ids |= seen
+                self.marks[key] = {'start_time': latest, 'execution_ids': sorted(execution_ids)}
+                self.changed = True
+            return new
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                marks = json.load(f)
+            if not isinstance(marks, dict) or not all(
+                    isinstance(mark, dict) and isinstance(mark.get('start_time'), str) and isinstance(mark.get('execution_ids'), list)
+                    for mark in marks.values()):
+                raise ValueError("expected a mapping of start_time and execution_ids per profile")
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable test results state file {self.path}: {e}")
+            return
+        with self.lock:
+            self.marks.update(marks)
+        logging.info(f"Loaded {len(marks)} network test result watermarks from {self.path}")
+
+    def save(self):
+        if not self.path or not self.changed:
+            return
+        with self.lock:
+            marks = dict(self.marks)
+            self.changed = False
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(marks, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.changed = True
+            logging.warning(f"Could not write test results state file {self.path}: {e}")
+
+class CircuitOpenError(Exception):
+    pass
+
+class RequestOutcome:
+    # Records how a call went in wyebot_api_requests and the circuit breaker,
+    # once. A streamed response is only settled when its rows have been read.
+    def __init__(self, client, endpoint, scopes):
+        self.client = client
+        self.endpoint = endpoint
+        self.scopes = scopes
+        self.deferred = False
+        self.recorded = False
+
+    def record(self, succeeded):
+        if self.recorded:
+            return
+        self.recorded = True
+        client = self.client
+        API_REQUESTS.labels(org=client.org, endpoint=self.endpoint, result='success' if succeeded else 'error').inc()
+        if client.breaker:
+            if succeeded:
+                client.breaker.record_success(self.scopes)
+            else:
+                client.breaker.record_failure(self.scopes)
+
+class CircuitBreaker:
+    # Counts consecutive failures per endpoint and per sensor. Once a scope
+    # reaches the threshold its calls are skipped until the cooldown has passed.
+    # The circuit is then half-open: a single trial call is let through and
+    # either closes it or re-opens it, while other callers are still skipped.
+    def __init__(self, org, threshold=BREAKER_FAILURE_THRESHOLD, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.org = org
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = {}
+        self.open_until = {}
+        self.lock = threading.Lock()
+
+    def scopes(self, endpoint, data):
+        scopes = [('endpoint', endpoint)]
+        if data and 'sensor_id' in data:
+            scopes.append(('sensor', str(data['sensor_id'])))
+        return scopes
+
+    def allow(self, scopes):
+        now = time.monotonic()
+        with self.lock:
+            if any(self.open_until.get(scope, 0) > now for scope in scopes):
+                return False
+            # This caller makes the trial call; the others are held off for
+            # another cooldown in case it never reports back.
+            for scope in scopes:
+                if scope in self.open_until:
+                    self.open_until[scope] = now + self.cooldown
+            return True
+
+    def record_success(self, scopes):
+        with self.lock:
+            for scope in scopes:
+                self.failures.pop(scope, None)
+                self.open_until.pop(scope, None)
+            self.update_metrics()
+
+    def record_failure(self, scopes):
+        with self.lock:
+            for scope in scopes:
+                failures = self.failures[scope] = self.failures.get(scope, 0) + 1
+                if failures >= self.threshold:
+                    if scope not in self.open_until:
+                        logging.warning(f"Opening circuit for {scope[0]} {scope[1]} of org {self.org} after {failures} consecutive failures")
+                    self.open_until[scope] = time.monotonic() + self.cooldown
+            self.update_metrics()
+
+    def update_metrics(self):
+        for kind in ('endpoint', 'sensor'):
+            CIRCUITS_OPEN.labels(org=self.org, scope=kind).set(sum(1 for scope in self.open_until if scope[0] == kind))
+
+class PollScheduler:
+    # Tracks when every (endpoint, sensor/location/profile) slot is next due.
+    # Slots are spread over the interval by a hash of their key so a fleet isn't
+    # polled in one burst, and an endpoint's interval is stretched while the API
+    # answers it with 429s or with latency well above its usual level.
+    def __init__(self, org, intervals, max_backoff=SCHEDULE_MAX_BACKOFF, latency_factor=SCHEDULE_LATENCY_FACTOR):
+        self.org = org
+        self.intervals = {endpoint: interval for endpoint, interval in intervals.items() if interval > 0}
+        self.max_backoff = max_backoff
+        self.latency_factor = latency_factor
+        self.backoff = {}
+        self.baselines = {}
+        self.next_due = {}
+        self.observations = {}
+        self.lock = threading.Lock()
+
+    def interval(self, endpoint):
+        path = ENDPOINT_PATHS.get(endpoint)
+        if path not in self.intervals:
+            return 0
+        return self.intervals[path] * self.backoff.get(path, 1.0)
+
+    def due(self, endpoint, key):
+        if not self.interval(endpoint):
+            return True
+        with self.lock:
+            return self.next_due.get((endpoint, key), 0) <= time.time()
+
+    def next_slot(self, endpoint, key, interval, now):
+        # The next point of this slot's phase grid at least half an interval out,
+        # so a slot keeps its place while the interval stays the same.
+        digest = hashlib.sha1(f"{endpoint.__name__}:{key}".encode()).digest()
+        phase = int.from_bytes(digest[:8], 'big') / 2 ** 64 * interval
+        return phase + -(-(now + interval / 2 - phase) // interval) * interval
+
+    def complete(self, endpoint, keys, seconds, throttled, succeeded):
+        # Only a successful call moves its slots on; a failed one stays due and
+        # is retried on the next tick.
+        interval = self.interval(endpoint)
+        if not interval or not keys:
+            return
+        path = ENDPOINT_PATHS[endpoint]
+        now = time.time()
+        with self.lock:
+            for key in keys if succeeded else ():
+                due = self.next_due.get((endpoint, key))
+                if due:
+                    SCHEDULE_LAG.labels(org=self.org, endpoint=path).observe(max(now - due, 0))
+                self.next_due[(endpoint, key)] = self.next_slot(endpoint, key, interval, now)
+            observations = self.observations.setdefault(path, [0, 0.0, 0])
+            observations[0] += 1
+            observations[1] += seconds
+            observations[2] += throttled
 
-def get_client_distribution(location_id=None, sensor_id=None):
-    url = f"{BASE_URL}/dashboard/clientdistributionlist"
-    headers = {"api_key": API_KEY}
+    def end_pass(self):
+        with self.lock:
+            for path, (calls, seconds, throttled) in self.observations.items():
+                latency = seconds / calls
+                baseline = self.baselines.setdefault(path, latency)
+                backoff = self.backoff.get(path, 1.0)
+                if throttled:
+                    backoff = min(backoff * 2, self.max_backoff)
+                    logging.warning(f"{path} was throttled {throttled} times for org {self.org}; polling it every {self.intervals[path] * backoff:.0f}s")
+                elif latency > baseline * self.latency_factor:
+                    backoff = min(backoff * 1.5, self.max_backoff)
+                else:
+                    backoff = max(backoff / 1.5, 1.0)
+                    self.baselines[path] = 0.9 * baseline + 0.1 * latency
+                self.backoff[path] = backoff
+            self.observations.clear()
+            for path, interval in self.intervals.items():
+                SCHEDULE_INTERVAL.labels(org=self.org, endpoint=path).set(interval * self.backoff.get(path, 1.0))
+
+class RateLimiter:
+    # Token bucket shared by every thread calling one organization's API, so a
+    # tenant's request rate stays under its limit however many calls are queued.
+    def __init__(self, org, rate):
+        self.org = org
+        self.rate = rate
+        self.capacity = max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            API_RATE_LIMIT_WAIT.labels(org=self.org).inc(wait)
+            time.sleep(wait)
+
+class WyebotClient:
+    def __init__(self, org, base_url, api_key, pool_size=HTTP_POOL_SIZE, connect_timeout=HTTP_CONNECT_TIMEOUT,
+                 read_timeout=HTTP_READ_TIMEOUT, max_retries=HTTP_MAX_RETRIES, backoff=HTTP_BACKOFF_SECONDS,
+                 backoff_max=HTTP_BACKOFF_MAX_SECONDS, cache=None, breaker=None, projections=None, rate_limiter=None):
+        self.org = org
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.cache = cache
+        self.breaker = breaker
+        self.projections = projections or {}
+        self.rate_limiter = rate_limiter
+        self.in_flight = API_IN_FLIGHT.labels(org=org)
+        self.urls = {}
+        self.local = threading.local()
+        # One keep-alive pool shared by every collector thread; retries are handled
+        # below so 429 and 5xx responses get jittered backoff instead of urllib3's.
+        self.session = requests.Session()
+        self.session.headers.update({"api_key": api_key})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def url(self, endpoint):
+        url = self.urls.get(endpoint)
+        if url is None:
+            url = self.urls[endpoint] = f"{self.base_url}{endpoint}"
+        return url
+
+    def get(self, endpoint):
+        return self.request('GET', endpoint)
+
+    def post(self, endpoint, data):
+        return self.request('POST', endpoint, data)
+
+    def request(self, method, endpoint, data=None):
+        key = None
+        if self.cache is not None and self.cache.cacheable(endpoint):
+            key = self.cache.key(endpoint, data)
+            response = self.cache.get(key)
+            if response is not None:
+                CACHE_HITS.labels(org=self.org, endpoint=endpoint).inc()
+                return response
+            CACHE_MISSES.labels(org=self.org, endpoint=endpoint).inc()
+        
+        scopes = self.breaker.scopes(endpoint, data) if self.breaker else ()
+        outcome = RequestOutcome(self, endpoint, scopes)
+        try:
+            if self.breaker and not self.breaker.allow(scopes):
+                API_REQUESTS.labels(org=self.org, endpoint=endpoint, result='circuit_open').inc()
+                raise CircuitOpenError(f"Circuit open for {endpoint} {data or ''}")
+            try:
+                response = self.fetch(method, endpoint, data, outcome)
+            except RESPONSE_ERRORS:
+                outcome.record(False)
+                raise
+        except RESPONSE_ERRORS + (CircuitOpenError,) as e:
+            response = self.cache.get_stale(key) if key else None
+            if response is None:
+                raise
+            CACHE_STALE_HITS.labels(org=self.org, endpoint=endpoint).inc()
+            logging.warning(f"Serving stale cached response for {endpoint} after error: {e}")
+            return response
+        
+        if not outcome.deferred:
+            outcome.record(True)
+        if key:
+            self.cache.put(key, response)
+        return response
+
+    def fetch(self, method, endpoint, data=None, outcome=None):
+        url = self.url(endpoint)
+        # Cached responses are reused by later passes, so only uncached endpoints stream.
+        projection = self.projections.get(endpoint)
+        if projection and self.cache is not None and self.cache.cacheable(endpoint):
+            projection = None
+        attempt = 0
+        while True:
+            try:
+                if self.rate_limiter:
+                    self.rate_limiter.acquire()
+                with self.in_flight.track_inprogress(), API_REQUEST_DURATION.labels(org=self.org, endpoint=endpoint).time():
+                    response = self.session.request(method, url, data=data, timeout=self.timeout, stream=projection is not None)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                reason = str(e)
+            else:
+                if response.status_code == 429:
+                    self.local.throttles = self.throttles() + 1
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    response.raise_for_status()  # Raise an exception for HTTP errors
+                    received = API_RESPONSE_BYTES.labels(org=self.org, endpoint=endpoint)
+                    if projection:
+                        return self.stream(response, projection, received, outcome)
+                    received.inc(len(response.content))
+                    start = time.perf_counter()
+                    parsed = response.json()
+                    self.local.decode_seconds = self.decode_seconds() + time.perf_counter() - start
+                    return parsed
+                delay = self.retry_after(response)
+                if delay is None:
+                    delay = self.backoff_delay(attempt)
+                reason = f"HTTP {response.status_code}"
+                response.close()
+            attempt += 1
+            API_RETRIES.labels(org=self.org, endpoint=endpoint).inc()
+            logging.warning(f"Retrying {endpoint} for org {self.org} in {delay:.2f}s (attempt {attempt}/{self.max_retries}): {reason}")
+            time.sleep(delay)
+
+    def stream(self, response, projection, received, outcome=None):
+        container, lists = projection
+        if len(lists) == 1:
+            # A single list is handed to the writer as a generator, so rows are
+            # parsed from the socket as the writer consumes them, and read or
+            # decode errors surface there; the call is settled once it's done.
+            if outcome:
+                outcome.deferred = True
+            rows = self.timed(stream_rows(response, container, lists, received), outcome)
+            name = next(iter(lists))
+            return {container: {name: (row for _, row in rows)}}
+        rows = self.timed(stream_rows(response, container, lists, received))
+        parsed = {container: {name: [] for name in lists}}
+        for name, row in rows:
+            parsed[container][name].append(row)
+        return parsed
+
+    def timed(self, rows, outcome=None):
+        # Streamed rows are read and parsed while the writer consumes them; that
+        # time is counted as decoding rather than writing. A writer that stops
+        # early leaves the response as it was read so far, which counts as a success.
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    row = next(rows, None)
+                finally:
+                    self.local.decode_seconds = self.decode_seconds() + time.perf_counter() - start
+                if row is None:
+                    break
+                yield row
+        except RESPONSE_ERRORS:
+            if outcome:
+                outcome.record(False)
+            raise
+        except GeneratorExit:
+            if outcome:
+                outcome.record(True)
+            raise
+        if outcome:
+            outcome.record(True)
+
+    def decode_seconds(self):
+        # Time the calling thread has spent decoding response bodies.
+        return getattr(self.local, 'decode_seconds', 0.0)
+
+    def throttles(self):
+        # 429 responses seen by the calling thread, so a caller can tell whether
+        # its own request was throttled.
+        return getattr(self.local, 'throttles', 0)
+
+    def backoff_delay(self, attempt):
+        # Full jitter keeps retries from many collector threads from lining up.
+        return random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+
+    def retry_after(self, response):
+        value = response.headers.get('Retry-After')
+        if value is None:
+            return None
+        try:
+            return min(max(float(value), 0), self.backoff_max)
+        except ValueError:
+            return None
+
+def project(row, fields):
+    projected = {}
+    for field in fields:
+        if isinstance(field, tuple):
+            name, nested = field
+            if isinstance(row.get(name), list):
+                projected[name] = [project(item, nested) for item in row[name]]
+        elif field in row:
+            projected[field] = row[field]
+    return projected
+
+def stream_rows(response, container, lists, received):
+    # Yields (list name, projected row) while the body is read in chunks; only
+    # the row currently being parsed is ever held in full.
+    targets = {name: ijson.sendable_list() for name in lists}
+    parsers = [ijson.items_coro(targets[name], f"{container}.{name}.item", use_float=True) for name in lists]
+    try:
+        chunks = response.iter_content(STREAM_CHUNK_SIZE)
+        while parsers:
+            chunk = next(chunks, b'')
+            received.inc(len(chunk))
+            for parser in parsers:
+                if chunk:
+                    parser.send(chunk)
+                else:
+                    parser.close()
+            for name, parsed in targets.items():
+                for row in parsed:
+                    yield name, project(row, lists[name])
+                del parsed[:]
+            if not chunk:
+                parsers = []
+    finally:
+        response.close()
+
+class Organization:
+    # Everything kept per Wyebot organization: an API client with its own
+    # connection pool, rate limit and circuit breaker, plus the response cache,
+    # polling schedule, test result watermarks and concurrency budget.
+    def __init__(self, name, base_url, api_key, max_concurrent_requests=MAX_CONCURRENT_REQUESTS, rate_limit=RATE_LIMIT,
+                 cache_file=CACHE_FILE, test_results_state_file=TEST_RESULTS_STATE_FILE):
+        self.name = name
+        self.max_concurrent_requests = max_concurrent_requests
+        self.cache = ResponseCache(name, CACHE_TTLS, path=cache_file)
+        self.watermarks = TestResultWatermarks(path=test_results_state_file)
+        self.scheduler = PollScheduler(name, SCHEDULE_INTERVALS)
+        self.client = WyebotClient(name, base_url, api_key, pool_size=min(HTTP_POOL_SIZE, max_concurrent_requests),
+                                   cache=self.cache, breaker=CircuitBreaker(name),
+                                   projections=STREAM_PROJECTIONS if STREAM_PARSING else None,
+                                   rate_limiter=RateLimiter(name, rate_limit))
+
+def load_organizations(path):
+    if not path:
+        return [Organization(ORG_NAME, BASE_URL, API_KEY)]
+    with open(path) as f:
+        config = json.load(f)
+    orgs = []
+    for entry in config.get('orgs', []):
+        name = entry['name']
+        if any(org.name == name for org in orgs):
+            raise ValueError(f"Organization {name} is listed twice in {path}")
+        # Keys can be kept out of the file by naming an environment variable.
+        api_key = entry.get('api_key') or os.environ.get(entry.get('api_key_env', ''), '')
+        if not api_key:
+            raise ValueError(f"Organization {name} in {path} has no api_key or api_key_env")
+        orgs.append(Organization(name, entry.get('base_url', BASE_URL), api_key,
+                                 max_concurrent_requests=int(entry.get('max_concurrent_requests', MAX_CONCURRENT_REQUESTS)),
+                                 rate_limit=float(entry.get('rate_limit', RATE_LIMIT)),
+                                 cache_file=f"{CACHE_FILE}.{name}" if CACHE_FILE else '',
+                                 test_results_state_file=f"{TEST_RESULTS_STATE_FILE}.{name}" if TEST_RESULTS_STATE_FILE else ''))
+    if not orgs:
+        raise ValueError(f"No organizations listed in {path}")
+    return orgs
+
+ORGS = load_organizations(ORGS_FILE)
+
+def dashboard_params(location_id=None, sensor_id=None):
     data = {}
     if location_id:
         data["location_id"] = location_id
     if sensor_id:
         data["sensor_id"] = sensor_id
-    response = requests.post(url, headers=headers, data=data)
-    response.raise_for_status()  # Raise an exception for HTTP errors
-    return response.json()
-
-def get_network_test_profiles(location_id):
-    url = f"{BASE_URL}/test/get_network_test_profiles"
-    headers = {"api_key": API_KEY}
-    data = {"location_id": location_id}
-    response = requests.post(url, headers=headers, data=data)
-    response.raise_for_status()  # Raise an exception for HTTP errors
-    return response.json()
-
-def get_network_test_results(location_id, network_test_profile_id, data_range_start_time, data_range_end_time):
-    url = f"{BASE_URL}/test/get_network_test_results"
-    headers = {"api_key": API_KEY}
+    return data
+
+def get_locations(client):
+    return client.get("/org/get_locations")
+
+def get_sensors(client, location_id):
+    return client.post("/org/get_sensors", {"location_id": location_id})
+
+def get_sensor_info(client, sensor_id):
+    return client.post("/org/get_sensor_info", {"sensor_id": sensor_id})
+
+def get_sensor_network_info(client, sensor_id):
+    return client.post("/org/get_sensor_network_info", {"sensor_id": sensor_id})
+
+def get_access_point_details(client, location_id=None, sensor_id=None):
+    return client.post("/dashboard/accesspointlist", dashboard_params(location_id, sensor_id))
+
+def get_client_details(client, location_id=None, sensor_id=None):
+    return client.post("/dashboard/clientlist", dashboard_params(location_id, sensor_id))
+
+def get_ssid_details(client, location_id=None, sensor_id=None):
+    return client.post("/dashboard/ssidlist", dashboard_params(location_id, sensor_id))
+
+def get_issue_details(client, sensor_id):
+    return client.post("/dashboard/sensor_issues", {"sensor_id": sensor_id})
+
+def get_rf_analytics(client, location_id=None, sensor_id=None):
+    return client.post("/dashboard/rf_analytics", dashboard_params(location_id, sensor_id))
+
+def get_client_distribution(client, location_id=None, sensor_id=None):
+    return client.post("/dashboard/clientdistributionlist", dashboard_params(location_id, sensor_id))
+
+def get_network_test_profiles(client, location_id):
+    return client.post("/test/get_network_test_profiles", {"location_id": location_id})
+
+def get_network_test_results(client, location_id, network_test_profile_id, data_range_start_time, data_range_end_time):
     data = {
         "location_id": location_id,
         "network_test_profile_id": network_test_profile_id,
         "data_range_start_time": data_range_start_time,
         "data_range_end_time": data_range_end_time
     }
-    response = requests.post(url, headers=headers, data=data)
-    response.raise_for_status()  # Raise an exception for HTTP errors
-    return response.json()
+    return client.post("/test/get_network_test_results", data)
+
+ENDPOINT_PATHS = {
+    get_locations: '/org/get_locations',
+    get_sensors: '/org/get_sensors',
+    get_sensor_info: '/org/get_sensor_info',
+    get_sensor_network_info: '/org/get_sensor_network_info',
+    get_access_point_details: '/dashboard/accesspointlist',
+    get_client_details: '/dashboard/clientlist',
+    get_ssid_details: '/dashboard/ssidlist',
+    get_issue_details: '/dashboard/sensor_issues',
+    get_rf_analytics: '/dashboard/rf_analytics',
+    get_client_distribution: '/dashboard/clientdistributionlist',
+    get_network_test_profiles: '/test/get_network_test_profiles',
+    get_network_test_results: '/test/get_network_test_results',
+}
+
+def location_shard(org, location_id):
+    # Rendezvous hashing: every replica computes the same owner without
+    # coordination, and changing the shard count only moves the locations
+    # whose highest-scoring shard was added or removed.
+    return max(range(SHARD_COUNT), key=lambda shard: hashlib.sha1(f"{shard}:{org.name}:{location_id}".encode()).digest())
+
+class CallQueue:
+    # Calls of a plan waiting to run, per organization and location. next()
+    # only hands out a call whose organization and location are below their
+    # concurrency limits, taking organizations and then their locations in
+    # turn, so no worker thread ever waits on a budget held by another tenant
+    # and no large site or organization holds up the rest.
+    def __init__(self, calls):
+        self.queues = {}
+        for call in calls:
+            self.queues.setdefault(call.org.name, {}).setdefault(call.location_id, deque()).append(call)
+        self.running = 0
+
+    def __len__(self):
+        return sum(len(calls) for locations in self.queues.values() for calls in locations.values())
+
+    def next(self):
+        # Called with RUNNING_CALLS held.
+        if sum(RUNNING_BY_ORG.values()) >= MAX_CONCURRENT_REQUESTS:
+            return None
+        for org_name, locations in self.queues.items():
+            for location_id, calls in locations.items():
+                org = calls[0].org
+                if RUNNING_BY_ORG.get(org_name, 0) >= org.max_concurrent_requests:
+                    break
+                if RUNNING_BY_LOCATION.get((org_name, location_id), 0) >= MAX_REQUESTS_PER_LOCATION:
+                    continue
+                call = calls.popleft()
+                # The location and the organization go to the back of the line.
+                del locations[location_id]
+                if calls:
+                    locations[location_id] = calls
+                del self.queues[org_name]
+                if locations:
+                    self.queues[org_name] = locations
+                RUNNING_BY_ORG[org_name] = RUNNING_BY_ORG.get(org_name, 0) + 1
+                RUNNING_BY_LOCATION[(org_name, location_id)] = RUNNING_BY_LOCATION.get((org_name, location_id), 0) + 1
+                self.running += 1
+                return call
+        return None
+
+    def finished(self, call):
+        with RUNNING_CALLS:
+            self.running -= 1
+            RUNNING_BY_ORG[call.org.name] -= 1
+            RUNNING_BY_LOCATION[(call.org.name, call.location_id)] -= 1
+            RUNNING_CALLS.notify_all()
+
+class PlannedCall:
+    def __init__(self, org, location_id, endpoint, params):
+        self.org = org
+        self.location_id = location_id
+        self.endpoint = endpoint
+        self.params = params
+        self.consumers = []
+        self.slots = set()
+        self.started = None
+        self.finished = None
+
+    def run(self):
+        client = self.org.client
+        path = ENDPOINT_PATHS[self.endpoint]
+        throttles = client.throttles()
+        decoded = client.decode_seconds()
+        self.started = time.monotonic()
+        try:
+            response = self.endpoint(client, **self.params)
+        except Exception:
+            self.finished = time.monotonic()
+            self.org.scheduler.complete(self.endpoint, self.slots, self.finished - self.started, client.throttles() > throttles, False)
+            raise
+        self.finished = time.monotonic()
+        fetch = self.finished - self.started
+        # Streamed bodies are decoded while the consumers run, so decoding time is
+        # taken out of both the fetch and the write phase.
+        decode = client.decode_seconds() - decoded
+        CALL_PHASE_DURATION.labels(phase='fetch', endpoint=path).observe(fetch - decode)
+        SERIES.context.org = self.org.name
+        SERIES.context.max_age = self.org.scheduler.interval(self.endpoint) * STALE_AFTER_PASSES
+        failed = False
+        decoded = client.decode_seconds()
+        start = time.perf_counter()
+        for consumer, args in self.consumers:
+            try:
+                consumer(response, *args)
+            except Exception as e:
+                failed = True
+                PROCESSING_ERRORS.labels(writer=consumer.__name__).inc()
+                logging.error(f"Error processing {self.endpoint.__name__}{self.params} for org {self.org.name} in {consumer.__name__}: {e}")
+        write_decode = client.decode_seconds() - decoded
+        write = time.perf_counter() - start - write_decode
+        CALL_PHASE_DURATION.labels(phase='decode', endpoint=path).observe(decode + write_decode)
+        CALL_PHASE_DURATION.labels(phase='write', endpoint=path).observe(write)
+        WRITE_SECONDS.inc(write)
+        self.finished = time.monotonic()
+        self.org.scheduler.complete(self.endpoint, self.slots, fetch, client.throttles() > throttles, not failed)
+        if not failed and 'sensor_id' in self.params:
+            SENSOR_UPDATES.mark(self.org.name, self.location_id, self.params['sensor_id'])
+        return not failed
+
+class RequestPlan:
+    # Collects every (endpoint, params) call a pass needs so each one is made
+    # once and its parsed response handed to all consumers that asked for it.
+    # phase names the plan in the pass phase timings.
+    def __init__(self, phase):
+        self.phase = phase
+        self.calls = {}
+        self.requested = 0
+
+    def add(self, org, location_id, endpoint, params, consumer, *args):
+        self.requested += 1
+        key = (org.name, endpoint.__name__, tuple(sorted(params.items())))
+        call = self.calls.get(key)
+        if call is None:
+            call = self.calls[key] = PlannedCall(org, location_id, endpoint, params)
+        if (consumer, args) not in call.consumers:
+            call.consumers.append((consumer, args))
+        return call
+
+    def add_scheduled(self, org, key, location_id, endpoint, params, consumer, *args):
+        # Only plans the call when its slot is due; the slot moves on once the
+        # call has succeeded, so failed calls and calls cut off by the deadline
+        # run next pass.
+        if org.scheduler.due(endpoint, key):
+            self.add(org, location_id, endpoint, params, consumer, *args).slots.add(key)
+
+    @property
+    def saved(self):
+        return self.requested - len(self.calls)
+
+    def execute(self, deadline):
+        with PASS_PHASE_DURATION.labels(phase=self.phase).time():
+            return self.run(deadline)
+
+    def run(self, deadline):
+        # Calls are only submitted once they have a free slot, so the executor
+        # never holds more work than it has threads. A slot is given back when
+        # the call returns, even after the deadline. Whatever hasn't started or
+        # finished by the pass deadline is skipped, and anything still waiting
+        # on the executor is cancelled.
+        queue = CallQueue(self.calls.values())
+        futures = {}
+        while time.monotonic() < deadline:
+            with RUNNING_CALLS:
+                call = queue.next()
+                if call is None:
+                    if not len(queue) and not queue.running:
+                        break
+                    RUNNING_CALLS.wait(max(deadline - time.monotonic(), 0))
+                    continue
+            future = EXECUTOR.submit(PROFILER.wrap(call.run))
+            future.add_done_callback(lambda future, call=call: queue.finished(call))
+            futures[future] = call
+        for future in futures:
+            future.cancel()
+        done = [future for future in futures if future.done() and not future.cancelled()]
+        
+        # Every call succeeds or fails on its own, so one broken sensor or
+        # endpoint never keeps the rest of the fleet from being published.
+        completed = failed = circuit_open = 0
+        skipped = len(futures) - len(done) + len(queue)
+        for future in done:
+            call = futures[future]
+            try:
+                if future.result():
+                    completed += 1
+                else:
+                    failed += 1
+            except CircuitOpenError:
+                circuit_open += 1
+            except Exception as e:
+                failed += 1
+                logging.error(f"Error calling {call.endpoint.__name__}{call.params} for org {call.org.name}: {e}")
+        return completed, failed, skipped, circuit_open
+
+    def location_spans(self, spans):
+        # Widens spans[(org name, location id)] to cover this plan's finished
+        # location calls; organization-wide calls have no location.
+        for call in self.calls.values():
+            if call.location_id is None or call.started is None or call.finished is None:
+                continue
+            span = spans.setdefault((call.org.name, call.location_id), [call.started, call.finished])
+            span[0] = min(span[0], call.started)
+            span[1] = max(span[1], call.finished)
+        return spans
+
+def set_info(metric, **labels):
+    SERIES.children(metric, [tuple(str(labels[name]) for name in FAMILY_LABELS[metric])], info=True)
+
+def set_gauge(metric, value, **labels):
+    SERIES.children(metric, [tuple(str(labels[name]) for name in FAMILY_LABELS[metric])])[0].set(value)
+
+def set_number(metric, value, **labels):
+    if value is not None:
+        set_gauge(metric, value, **labels)
+
+# Batched writes for row-heavy families: the label values shared by every row
+# (location, sensor, SSID) are built once as a prefix, and a whole batch is
+# written with one call into the series tracker.
+
+def sensor_labels(location_id, location_name, sensor_id, sensor_name):
+    return (str(location_id), location_name, str(sensor_id), sensor_name)
+
+def label_rows(metric, prefix, rows):
+    # The remaining labels are read from the row fields of the same name.
+    fields = FAMILY_LABELS[metric][len(prefix):]
+    return [prefix + tuple([str(row.get(field, '')) for field in fields]) for row in rows]
+
+def set_infos(metric, rows):
+    SERIES.children(metric, rows, info=True)
+
+def set_gauges(metric, rows):
+    # rows are (label values, value) pairs; pairs without a value are skipped
+    # like set_number does.
+    rows = [row for row in rows if row[1] is not None]
+    for child, (_, value) in zip(SERIES.children(metric, [labelvalues for labelvalues, _ in rows]), rows):
+        child.set(value)
+
+NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+DURATION_PATTERN = re.compile(r'(?:(\d+)\s*days?,?\s*)?(\d+):(\d{2}):(\d{2})')
+
+def parse_number(value):
+    # API numbers arrive as numbers or as strings such as "-45 dBm" or "866 Mbps".
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    match = NUMBER_PATTERN.search(str(value))
+    return float(match.group()) if match else None
+
+def parse_duration(value):
+    # Durations are either plain seconds or "1 day, 02:03:04" style strings.
+    match = DURATION_PATTERN.search(str(value))
+    if match:
+        days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+        return days * 86400 + hours * 3600 + minutes * 60 + seconds
+    return parse_number(value)
+
+def write_locations(response, org, locations_by_org):
+    locations = response.get('location_details', {}).get('data', [])
+    if SHARD_COUNT > 1:
+        locations = [location for location in locations if location_shard(org, location.get('location_id')) == SHARD_INDEX]
+    set_gauge(LOCATION_COUNT, len(locations))
+    locations_by_org[org.name] = locations
+
+def write_location_sensors(response, location_id, location_name, sensors_by_location):
+    sensors = response.get('sensor_details', {}).get('data', [])
+    set_gauge(SENSOR_COUNT, len(sensors), location_id=str(location_id), location_name=location_name)
+    valid_sensors = [sensor for sensor in sensors if 'sensor_id' in sensor and 'sensor_name' in sensor]
+    if len(valid_sensors) != len(sensors):
+        logging.error(f"Ignoring {len(sensors) - len(valid_sensors)} sensors without sensor_id or sensor_name at location {location_id}")
+    sensors_by_location[location_id] = valid_sensors
+
+def write_sensor_info(response, location_id, location_name, sensor_id, sensor_name):
+    if NUMERIC_METRICS:
+        return write_sensor_info_numeric(response, location_id, location_name, sensor_id, sensor_name)
+    
+    sensor_info = response.get('sensor_info', {}).get('data', {})
+    hardware_details = sensor_info.get('hardware_details', {})
+    specification = hardware_details.get('specification', {})
+    service = hardware_details.get('service', {})
+    
+    set_info(SENSOR_DATA,
+        location_id=str(location_id),
+        location_name=location_name,
+        sensor_id=str(sensor_id),
+        sensor_name=sensor_name,
+        model=specification.get('model', ''),
+        serial_number=specification.get('serial_number', ''),
+        wireless_mac_address=specification.get('wireless_mac_address', ''),
+        wired_mac_address=specification.get('wired_mac_address', ''),
+        link_speed=specification.get('link_speed', ''),
+        power_source=specification.get('power_source', ''),
+        uptime=service.get('uptime', ''),
+        software_version=service.get('software_version', ''),
+        license_info=service.get('license_info', '')
+    )
+    
+    lldp_info = hardware_details.get('lldp_info', {}).get('lldp', {}).get('interface', {})
+    
+    for interface, lldp_data in lldp_info.items():
+        chassis = lldp_data.get('chassis', {}).get('sw01', {})
+        port = lldp_data.get('port', {})
+        auto_negotiation = port.get('auto-negotiation', {})
+        
+        set_info(SENSOR_LLDP_INFO,
+            location_id=str(location_id),
+            location_name=location_name,
+            sensor_id=str(sensor_id),
+            sensor_name=sensor_name,
+            interface=interface,
+            via=lldp_data.get('via', ''),
+            age=lldp_data.get('age', ''),
+            vlan_id=lldp_data.get('vlan', {}).get('vlan-id', ''),
+            pvid=str(lldp_data.get('vlan', {}).get('pvid', '')),
+            chassis_capability=chassis.get('capability', {}).get('type', ''),
+            chassis_mgmt_ip=chassis.get('mgmt-ip', ''),
+            chassis_id=chassis.get('id', {}).get('value', ''),
+            chassis_descr=chassis.get('descr', ''),
+            port_descr=port.get('descr', ''),
+            port_id=port.get('id', {}).get('value', ''),
+            auto_negotiation_current=auto_negotiation.get('current', '')
+        )
+
+def write_sensor_network_info(response, location_id, location_name, sensor_id, sensor_name):
+    sensor_network_info = response.get('sensor_network_info', {}).get('data', {})
+    
+    set_info(SENSOR_NETWORK_INFO,
+        location_id=str(location_id),
+        location_name=location_name,
+        sensor_id=str(sensor_id),
+        sensor_name=sensor_name,
+        connection_type=sensor_network_info.get('connection_type', ''),
+        dhcp=str(sensor_network_info.get('dhcp', '')),
+        ipaddr=sensor_network_info.get('ipaddr', ''),
+        ip_subnet=sensor_network_info.get('ip_subnet', ''),
+        ip_gateway=sensor_network_info.get('ip_gateway', ''),
+        dns1=sensor_network_info.get('dns1', ''),
+        dns2=sensor_network_info.get('dns2', ''),
+        wireless_network=sensor_network_info.get('wireless_network', '')
+    )
+
+def write_access_points(response, location_id, location_name, sensor_id, sensor_name):
+    if NUMERIC_METRICS:
+        return write_access_points_numeric(response, location_id, location_name, sensor_id, sensor_name)
+    
+    access_point_details = response.get('access_point_details', {}).get('data', [])
+    
+    prefix = sensor_labels(location_id, location_name, sensor_id, sensor_name)
+    set_infos(ACCESS_POINT_DETAILS, label_rows(ACCESS_POINT_DETAILS, prefix, access_point_details))
+
+def write_clients(response, location_id, location_name, sensor_id, sensor_name):
+    client_details = response.get('client_details', {}).get('data', [])
+    
+    prefix = sensor_labels(location_id, location_name, sensor_id, sensor_name)
+    set_infos(CLIENT_DETAILS, label_rows(CLIENT_DETAILS, prefix, client_details))
+
+def write_ssids(response, location_id, location_name, sensor_id, sensor_name):
+    if NUMERIC_METRICS:
+        return write_ssids_numeric(response, location_id, location_name, sensor_id, sensor_name)
+    
+    ssid_details = response.get('ssid_details', {}).get('data', [])
+    
+    prefix = sensor_labels(location_id, location_name, sensor_id, sensor_name)
+    rows = []
+    for ssid in ssid_details:
+        ssid_prefix = prefix + tuple(str(ssid.get(field, '')) for field in ('ssid', 'total_bssids', 'security_name', 'hidden_ssid'))
+        rows.extend(label_rows(SSID_DETAILS, ssid_prefix, ssid.get('bssid_details_array', [])))
+    set_infos(SSID_DETAILS, rows)
+
+def write_issues(response, location_id, location_name, sensor_id, sensor_name):
+    issue_details = response.get('issue_details', {}).get('data', [])
+    
+    prefix = sensor_labels(location_id, location_name, sensor_id, sensor_name)
+    set_infos(ISSUE_DETAILS, label_rows(ISSUE_DETAILS, prefix, issue_details))
+
+def write_rf_analytics(response, location_id, location_name, sensor_id, sensor_name):
+    if NUMERIC_METRICS:
+        return write_rf_analytics_numeric(response, location_id, location_name, sensor_id, sensor_name)
+    
+    rf_analytics = response.get('rf_details', {}).get('data', {})
+    
+    if isinstance(rf_analytics, list):
+        for rf in rf_analytics:
+            set_info(RF_ANALYTICS,
+                location_id=str(location_id),
+                location_name=location_name,
+                sensor_id=str(rf.get('sensor_id', '')),
+                sensor_name=rf.get('sensor_name', ''),
+                radio_id='radio1',
+                channel=str(rf.get('channel_radio1', '')),
+                airtime_total_percent=str(rf.get('airtime_percent_radio1', '')),
+                mgmt_percent='',
+                ctrl_percent='',
+                data_percent='',
+                others_percent='',
+                available_percent='',
+                noise='',
+                client_mac_list='',
+                client_hostname_list='',
+                client_airtime_percentage=''
+            )
+            set_info(RF_ANALYTICS,
+                location_id=str(location_id),
+                location_name=location_name,
+                sensor_id=str(rf.get('sensor_id', '')),
+                sensor_name=rf.get('sensor_name', ''),
+                radio_id='radio2',
+                channel=str(rf.get('channel_radio2', '')),
+                airtime_total_percent=str(rf.get('airtime_percent_radio2', '')),
+                mgmt_percent='',
+                ctrl_percent='',
+                data_percent='',
+                others_percent='',
+                available_percent='',
+                noise='',
+                client_mac_list='',
+                client_hostname_list='',
+                client_airtime_percentage=''
+            )
+    else:
+        for radio_id, rf in rf_analytics.items():
+            set_info(RF_ANALYTICS,
+                location_id=str(location_id),
+                location_name=location_name,
+                sensor_id=str(sensor_id),
+                sensor_name=sensor_name,
+                radio_id=radio_id,
+                channel=str(rf.get('channel', '')),
+                airtime_total_percent=str(rf.get('airtime_total_percent', '')),
+                mgmt_percent=str(rf.get('mgmt_percent', '')),
+                ctrl_percent=str(rf.get('ctrl_percent', '')),
+                data_percent=str(rf.get('data_percent', '')),
+                others_percent=str(rf.get('others_percent', '')),
+                available_percent=str(rf.get('available_percent', '')),
+                noise=str(rf.get('noise', '')),
+                client_mac_list=','.join(rf.get('client_mac_list', [])),
+                client_hostname_list=','.join(rf.get('client_hostname_list', [])),
+                client_airtime_percentage=str(rf.get('client_airtime_percentage', ''))
+            )
+
+def write_client_band_usage(response, location_id, location_name, sensor_id, sensor_name):
+    if NUMERIC_METRICS:
+        return write_client_band_usage_numeric(response, location_id, location_name, sensor_id, sensor_name)
+    
+    client_distribution = response.get('client_distribution_list', {}).get('band_usage_array', [])
+    
+    for dist in client_distribution:
+        set_info(CLIENT_DISTRIBUTION,
+            location_id=str(location_id),
+            location_name=location_name,
+            sensor_id=str(sensor_id),
+            sensor_name=sensor_name,
+            band=dist.get('band', ''),
+            total=str(dist.get('total', '')),
+            percentage=dist.get('percentage', ''),
+            mac_address='',
+            hostname='',
+            current_band='',
+            capability_band='',
+            category_id='',
+            vendor='',
+            ssid=''
+        )
+
+def write_client_distribution(response, location_id, location_name, sensor_id, sensor_name):
+    if NUMERIC_METRICS:
+        return write_client_distribution_numeric(response, location_id, location_name, sensor_id, sensor_name)
+    
+    client_distribution_data = response.get('client_distribution_list', {}).get('data', [])
+    
+    # Client rows leave the band usage labels (band, total, percentage) empty.
+    prefix = sensor_labels(location_id, location_name, sensor_id, sensor_name) + ('', '', '')
+    set_infos(CLIENT_DISTRIBUTION, label_rows(CLIENT_DISTRIBUTION, prefix, client_distribution_data))
+
+RF_GAUGES = {
+    'channel': RF_CHANNEL,
+    'airtime_total_percent': RF_AIRTIME,
+    'mgmt_percent': RF_MGMT,
+    'ctrl_percent': RF_CTRL,
+    'data_percent': RF_DATA,
+    'others_percent': RF_OTHERS,
+    'available_percent': RF_AVAILABLE,
+    'noise': RF_NOISE,
+    'client_airtime_percentage': RF_CLIENT_AIRTIME,
+}
+
+def write_sensor_info_numeric(response, location_id, location_name, sensor_id, sensor_name):
+    sensor_info = response.get('sensor_info', {}).get('data', {})
+    hardware_details = sensor_info.get('hardware_details', {})
+    specification = hardware_details.get('specification', {})
+    service = hardware_details.get('service', {})
+    
+    set_info(SENSOR,
+        location_id=str(location_id),
+        location_name=location_name,
+        sensor_id=str(sensor_id),
+        sensor_name=sensor_name,
+        model=specification.get('model', ''),
+        serial_number=specification.get('serial_number', ''),
+        wireless_mac_address=specification.get('wireless_mac_address', ''),
+        wired_mac_address=specification.get('wired_mac_address', ''),
+        link_speed=specification.get('link_speed', ''),
+        power_source=specification.get('power_source', ''),
+        software_version=service.get('software_version', ''),
+        license_info=service.get('license_info', '')
+    )
+    set_number(SENSOR_UPTIME, parse_duration(service.get('uptime', '')), sensor_id=str(sensor_id))
+    
+    lldp_info = hardware_details.get('lldp_info', {}).get('lldp', {}).get('interface', {})
+    
+    for interface, lldp_data in lldp_info.items():
+        chassis = lldp_data.get('chassis', {}).get('sw01', {})
+        port = lldp_data.get('port', {})
+        auto_negotiation = port.get('auto-negotiation', {})
+        
+        set_info(SENSOR_LLDP_NEIGHBOR,
+            location_id=str(location_id),
+            location_name=location_name,
+            sensor_id=str(sensor_id),
+            sensor_name=sensor_name,
+            interface=interface,
+            via=lldp_data.get('via', ''),
+            vlan_id=lldp_data.get('vlan', {}).get('vlan-id', ''),
+            pvid=str(lldp_data.get('vlan', {}).get('pvid', '')),
+            chassis_capability=chassis.get('capability', {}).get('type', ''),
+            chassis_mgmt_ip=chassis.get('mgmt-ip', ''),
+            chassis_id=chassis.get('id', {}).get('value', ''),
+            chassis_descr=chassis.get('descr', ''),
+            port_descr=port.get('descr', ''),
+            port_id=port.get('id', {}).get('value', ''),
+            auto_negotiation_current=auto_negotiation.get('current', '')
+        )
+        set_number(SENSOR_LLDP_AGE, parse_duration(lldp_data.get('age', '')), sensor_id=str(sensor_id), interface=interface)
+
+def write_access_points_numeric(response, location_id, location_name, sensor_id, sensor_name):
+    # Both families are written from the same rows, so streamed rows are collected first.
+    access_point_details = list(response.get('access_point_details', {}).get('data', []))
+    
+    prefix = sensor_labels(location_id, location_name, sensor_id, sensor_name)
+    set_infos(AP, label_rows(AP, prefix, access_point_details))
+    set_gauges(AP_SIGNAL, [((str(sensor_id), str(ap.get('mac_address', ''))), parse_number(ap.get('signal_strength', ''))) for ap in access_point_details])
+
+def write_ssids_numeric(response, location_id, location_name, sensor_id, sensor_name):
+    ssid_details = response.get('ssid_details', {}).get('data', [])
+    
+    prefix = sensor_labels(location_id, location_name, sensor_id, sensor_name)
+    bssids, ssid_bssids, ssid_clients, ssid_signal = [], [], [], []
+    for ssid in ssid_details:
+        ssid_labels = (str(sensor_id), str(ssid.get('ssid', '')))
+        ssid_bssids.append((ssid_labels, parse_number(ssid.get('total_bssids', ''))))
+        bssid_details = ssid.get('bssid_details_array', [])
+        ssid_prefix = prefix + tuple(str(ssid.get(field, '')) for field in ('ssid', 'security_name', 'hidden_ssid'))
+        bssids.extend(label_rows(BSSID, ssid_prefix, bssid_details))
+        for bssid in bssid_details:
+            labels = ssid_labels + (str(bssid.get('bssid', '')),)
+            ssid_clients.append((labels, parse_number(bssid.get('total_clients', ''))))
+            ssid_signal.append((labels, parse_number(bssid.get('signal_strength', ''))))
+    set_gauges(SSID_BSSIDS, ssid_bssids)
+    set_infos(BSSID, bssids)
+    set_gauges(SSID_CLIENTS, ssid_clients)
+    set_gauges(SSID_SIGNAL, ssid_signal)
+
+def write_rf_analytics_numeric(response, location_id, location_name, sensor_id, sensor_name):
+    rf_analytics = response.get('rf_details', {}).get('data', {})
+    
+    if isinstance(rf_analytics, list):
+        for rf in rf_analytics:
+            for radio in ('radio1', 'radio2'):
+                labels = {'sensor_id': str(rf.get('sensor_id', '')), 'radio': radio}
+                set_number(RF_CHANNEL, parse_number(rf.get(f'channel_{radio}', '')), **labels)
+                set_number(RF_AIRTIME, parse_number(rf.get(f'airtime_percent_{radio}', '')), **labels)
+    else:
+        for radio_id, rf in rf_analytics.items():
+            labels = {'sensor_id': str(sensor_id), 'radio': radio_id}
+            for key, gauge in RF_GAUGES.items():
+                set_number(gauge, parse_number(rf.get(key, '')), **labels)
+            if 'client_mac_list' in rf:
+                set_gauge(RF_CLIENTS, len(rf['client_mac_list']), **labels)
+
+def write_client_band_usage_numeric(response, location_id, location_name, sensor_id, sensor_name):
+    client_distribution = response.get('client_distribution_list', {}).get('band_usage_array', [])
+    
+    for dist in client_distribution:
+        labels = {'sensor_id': str(sensor_id), 'band': dist.get('band', '')}
+        set_number(CLIENT_BAND_CLIENTS, parse_number(dist.get('total', '')), **labels)
+        set_number(CLIENT_BAND_PERCENT, parse_number(dist.get('percentage', '')), **labels)
+
+def write_client_distribution_numeric(response, location_id, location_name, sensor_id, sensor_name):
+    client_distribution_data = response.get('client_distribution_list', {}).get('data', [])
+    
+    prefix = sensor_labels(location_id, location_name, sensor_id, sensor_name)
+    set_infos(CLIENT_BAND, label_rows(CLIENT_BAND, prefix, client_distribution_data))
+
+def write_network_test_profiles(response, location_id, location_name, profiles_by_location):
+    network_test_profiles = response.get('network_test_profiles', {}).get('data', [])
+    
+    for profile in network_test_profiles:
+        set_info(NETWORK_TEST_PROFILES,
+            location_id=str(location_id),
+            location_name=location_name,
+            network_test_profile_id=str(profile.get('network_test_profile_id', '')),
+            network_test_profile_name=profile.get('network_test_profile_name', ''),
+            network_test_suite_id=str(profile.get('network_test_suite_id', '')),
+            network_test_suite_name=profile.get('network_test_suite_name', ''),
+            ssid=profile.get('ssid', ''),
+            schedule_type_id=str(profile.get('schedule_type_id', '')),
+            schedule=profile.get('schedule', ''),
+            enabled=str(profile.get('enabled', '')),
+            is_valid=str(profile.get('is_valid', ''))
+        )
+    profiles_by_location[location_id] = network_test_profiles
+
+def parse_test_time(value):
+    try:
+        return datetime.strptime(str(value), TEST_RESULTS_TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+def write_network_test_results(response, watermarks, location_id, location_name, network_test_profile_id, network_test_profile_name):
+    network_test_results = response.get('network_test_results', {}).get('data', [])
+    new_results = watermarks.new_results(location_id, network_test_profile_id, network_test_results)
+    
+    for result in new_results:
+        NETWORK_TEST_RUNS.labels(
+            org=SERIES.context.org,
+            location_id=str(location_id),
+            network_test_profile_id=str(network_test_profile_id),
+            result_status_name=result.get('result_status_name', '')
+        ).inc()
+        # Results are processed oldest first, so the last row per sensor wins.
+        LAST_TEST_RESULTS.set(SERIES.context.org, location_id, network_test_profile_id, result.get('sensor_id', ''),
+                              parse_number(result.get('result_status_id', '')), parse_test_time(result.get('start_time', '')))
+        if NUMERIC_METRICS:
+            continue
+        set_info(NETWORK_TEST_RESULTS,
+            location_id=str(location_id),
+            location_name=location_name,
+            sensor_id=str(result.get('sensor_id', '')),
+            sensor_name=result.get('sensor_name', ''),
+            network_test_profile_id=str(network_test_profile_id),
+            network_test_profile_name=network_test_profile_name,
+            network_test_suite_id=str(result.get('network_test_suite_id', '')),
+            network_test_suite_name=result.get('network_test_suite_name', ''),
+            result_status_id=str(result.get('result_status_id', '')),
+            result_status_name=result.get('result_status_name', ''),
+            start_time=str(result.get('start_time', '')),
+            scheduled_time=result.get('scheduled_time', ''),
+            execution_id=str(result.get('execution_id', ''))
+        )
+
+# Location-wide dashboard responses that can be split back into per-sensor rows.
+BULK_ENDPOINTS = {
+    get_access_point_details: ('access_point_details', write_access_points),
+    get_client_details: ('client_details', write_clients),
+    get_ssid_details: ('ssid_details', write_ssids),
+    get_rf_analytics: ('rf_details', write_rf_analytics),
+}
+# (organization name, endpoint) pairs whose location-wide rows couldn't be split
+# by sensor, with the time after which the bulk call is tried again.
+UNSPLITTABLE_ENDPOINTS = {}
+
+def unsplittable(org, endpoint):
+    until = UNSPLITTABLE_ENDPOINTS.get((org.name, endpoint))
+    if until is None:
+        return False
+    if until <= time.time():
+        UNSPLITTABLE_ENDPOINTS.pop((org.name, endpoint), None)
+        return False
+    return True
+
+def write_bulk(response, endpoint, org, location_id, location_name, sensor_names, fallbacks):
+    key, writer = BULK_ENDPOINTS[endpoint]
+    rows = response.get(key, {}).get('data', [])
+    if isinstance(rows, GeneratorType):
+        # Streamed rows are grouped by sensor below, so they are collected first.
+        rows = list(rows)
+    if not isinstance(rows, list) or any('sensor_id' not in row for row in rows):
+        UNSPLITTABLE_ENDPOINTS[(org.name, endpoint)] = time.time() + BULK_REPROBE_SECONDS
+        fallbacks.append((org, location_id, endpoint))
+        logging.warning(f"{endpoint.__name__} rows for location {location_id} in org {org.name} don't carry a sensor_id; falling back to per-sensor calls")
+        return
+    
+    rows_by_sensor = {}
+    for row in rows:
+        rows_by_sensor.setdefault(str(row['sensor_id']), []).append(row)
+    # Each sensor is written on its own, as it would be with per-sensor calls, so
+    # one malformed row doesn't keep the rest of the location from being written.
+    for sensor_id, sensor_name in sensor_names.items():
+        try:
+            writer({key: {'data': rows_by_sensor.get(str(sensor_id), [])}}, location_id, location_name, sensor_id, sensor_name)
+        except Exception as e:
+            PROCESSING_ERRORS.labels(writer=writer.__name__).inc()
+            logging.error(f"Error processing {endpoint.__name__} rows of sensor {sensor_id} at location {location_id} for org {org.name} in {writer.__name__}: {e}")
+            continue
+        SENSOR_UPDATES.mark(org.name, location_id, sensor_id)
+
+def plan_location_requests(plan, org, location_id, location_name, sensors_by_location, profiles_by_location):
+    set_info(LOCATION_DETAILS, location_id=str(location_id), location_name=location_name)
+    plan.add(org, location_id, get_sensors, {"location_id": location_id}, write_location_sensors, location_id, location_name, sensors_by_location)
+    plan.add(org, location_id, get_network_test_profiles, {"location_id": location_id}, write_network_test_profiles, location_id, location_name, profiles_by_location)
+
+def plan_bulk_requests(plan, org, location_id, location_name, sensors, fallbacks):
+    sensor_names = {sensor['sensor_id']: sensor['sensor_name'] for sensor in sensors}
+    for endpoint in BULK_ENDPOINTS:
+        if not unsplittable(org, endpoint):
+            plan.add_scheduled(org, location_id, location_id, endpoint, {"location_id": location_id}, write_bulk, endpoint, org, location_id, location_name, sensor_names, fallbacks)
+
+def plan_dashboard_requests(plan, org, location_id, location_name, sensor, endpoints):
+    args = (location_id, location_name, sensor['sensor_id'], sensor['sensor_name'])
+    dashboard = {"location_id": location_id, "sensor_id": sensor['sensor_id']}
+    for endpoint in endpoints:
+        plan.add_scheduled(org, sensor['sensor_id'], location_id, endpoint, dashboard, BULK_ENDPOINTS[endpoint][1], *args)
+
+def plan_test_result_requests(plan, org, location_id, location_name, profiles, now):
+    # Test results are location-scoped, so they are requested once per profile
+    # for the interval since the newest result already seen.
+    for profile in profiles:
+        network_test_profile_id = profile.get('network_test_profile_id')
+        start_time, end_time = org.watermarks.window(location_id, network_test_profile_id, now)
+        plan.add_scheduled(org, (location_id, network_test_profile_id), location_id, get_network_test_results, {
+            "location_id": location_id,
+            "network_test_profile_id": network_test_profile_id,
+            "data_range_start_time": start_time,
+            "data_range_end_time": end_time
+        }, write_network_test_results, org.watermarks, location_id, location_name, network_test_profile_id, profile.get('network_test_profile_name', ''))
+
+def plan_sensor_requests(plan, org, location_id, location_name, sensor):
+    sensor_id = sensor['sensor_id']
+    sensor_name = sensor['sensor_name']
+    set_info(SENSOR_DETAILS,
+        location_id=str(location_id),
+        location_name=location_name,
+        sensor_id=str(sensor_id),
+        sensor_name=sensor_name
+    )
+    
+    args = (location_id, location_name, sensor_id, sensor_name)
+    sensor_params = {"sensor_id": sensor_id}
+    dashboard = {"location_id": location_id, "sensor_id": sensor_id}
+    plan.add_scheduled(org, sensor_id, location_id, get_sensor_info, sensor_params, write_sensor_info, *args)
+    plan.add_scheduled(org, sensor_id, location_id, get_sensor_network_info, sensor_params, write_sensor_network_info, *args)
+    plan.add_scheduled(org, sensor_id, location_id, get_issue_details, sensor_params, write_issues, *args)
+    # Band usage is a per-request aggregate that can't be attributed to sensors
+    # from a location-wide response, so client distribution is always per sensor.
+    plan.add_scheduled(org, sensor_id, location_id, get_client_distribution, dashboard, write_client_band_usage, *args)
+    plan.add_scheduled(org, sensor_id, location_id, get_client_distribution, dashboard, write_client_distribution, *args)
+    if BULK_FETCH:
+        plan_dashboard_requests(plan, org, location_id, location_name, sensor, [endpoint for endpoint in BULK_ENDPOINTS if unsplittable(org, endpoint)])
+    else:
+        plan_dashboard_requests(plan, org, location_id, location_name, sensor, BULK_ENDPOINTS)
 
 def collect_metrics():
+    PROFILER.start()
     with REQUEST_TIME.time():
         try:
-            locations = get_locations().get('location_details', {}).get('data', [])
-            LOCATION_COUNT.set(len(locations))
+            deadline = time.monotonic() + PASS_DEADLINE_SECONDS
+            # Per-organization state for this pass, keyed by organization name.
+            location_names = {}
+            sensors_by_location = {}
+            profiles_by_location = {}
+            # Locations are listed like every other call, so a slow or failing
+            # organization only holds up its own pass and the deadline applies.
+            locations_by_org = {}
+            list_plan = RequestPlan('list_locations')
+            for org in ORGS:
+                list_plan.add(org, None, get_locations, {}, write_locations, org, locations_by_org)
+            list_results = list_plan.execute(deadline)
+            
+            location_plan = RequestPlan('location_calls')
+            for org in ORGS:
+                if org.name not in locations_by_org:
+                    continue
+                SERIES.context.org = org.name
+                names = location_names[org.name] = {}
+                sensors_by_location[org.name] = {}
+                profiles_by_location[org.name] = {}
+                for location in locations_by_org[org.name]:
+                    try:
+                        location_id = location['location_id']
+                        location_name = location['location_name']
+                    except KeyError as e:
+                        logging.error(f"Ignoring location without {e} in org {org.name}: {location}")
+                        continue
+                    names[location_id] = location_name
+                    plan_location_requests(location_plan, org, location_id, location_name, sensors_by_location[org.name], profiles_by_location[org.name])
+            
+            location_results = location_plan.execute(deadline)
+            
+            phase_start = time.perf_counter()
+            sensor_plan = RequestPlan('sensor_calls')
+            fallbacks = []
+            now = datetime.now(timezone.utc)
+            for org in ORGS:
+                SERIES.context.org = org.name
+                for location_id, sensors in sensors_by_location.get(org.name, {}).items():
+                    location_name = location_names[org.name][location_id]
+                    plan_test_result_requests(sensor_plan, org, location_id, location_name, profiles_by_location[org.name].get(location_id, []), now)
+                    if BULK_FETCH:
+                        plan_bulk_requests(sensor_plan, org, location_id, location_name, sensors, fallbacks)
+                    for sensor in sensors:
+                        plan_sensor_requests(sensor_plan, org, location_id, location_name, sensor)
+            
+            PASS_PHASE_DURATION.labels(phase='plan_sensors').observe(time.perf_counter() - phase_start)
+            plans = [list_plan, location_plan, sensor_plan]
+            results = [list_results, location_results, sensor_plan.execute(deadline)]
+            
+            if fallbacks:
+                fallback_plan = RequestPlan('fallback_calls')
+                for org, location_id, endpoint in fallbacks:
+                    for sensor in sensors_by_location[org.name][location_id]:
+                        plan_dashboard_requests(fallback_plan, org, location_id, location_names[org.name][location_id], sensor, [endpoint])
+                plans.append(fallback_plan)
+                results.append(fallback_plan.execute(deadline))
             
-            for location in locations:
-                location_id = location['location_id']
-                location_name = location['location_name']
-                LOCATION_DETAILS.labels(location_id=str(location_id), location_name=location_name).info({})
-                
-                sensors = get_sensors(location_id).get('sensor_details', {}).get('data', [])
-                SENSOR_COUNT.labels(location_id=str(location_id), location_name=location_name).set(len(sensors))
-                
-                for sensor in sensors:
-                    sensor_id = sensor['sensor_id']
-                    sensor_name = sensor['sensor_name']
-                    SENSOR_DETAILS.labels(
-                        location_id=str(location_id),
-                        location_name=location_name,
-                        sensor_id=str(sensor_id),
-                        sensor_name=sensor_name
-                    ).info({})
-                    
-                    sensor_info = get_sensor_info(sensor_id).get('sensor_info', {}).get('data', {})
-                    hardware_details = sensor_info.get('hardware_details', {})
-                    specification = hardware_details.get('specification', {})
-                    service = hardware_details.get('service', {})
-                    
-                    SENSOR_DATA.labels(
-                        location_id=str(location_id),
-                        location_name=location_name,
-                        sensor_id=str(sensor_id),
-                        sensor_name=sensor_name,
-                        model=specification.get('model', ''),
-                        serial_number=specification.get('serial_number', ''),
-                        wireless_mac_address=specification.get('wireless_mac_address', ''),
-                        wired_mac_address=specification.get('wired_mac_address', ''),
-                        link_speed=specification.get('link_speed', ''),
-                        power_source=specification.get('power_source', ''),
-                        uptime=service.get('uptime', ''),
-                        software_version=service.get('software_version', ''),
-                        license_info=service.get('license_info', '')
-                    ).info({})
-                    
-                    sensor_network_info = get_sensor_network_info(sensor_id).get('sensor_network_info', {}).get('data', {})
-                    
-                    SENSOR_NETWORK_INFO.labels(
-                        location_id=str(location_id),
-                        location_name=location_name,
-                        sensor_id=str(sensor_id),
-                        sensor_name=sensor_name,
-                        connection_type=sensor_network_info.get('connection_type', ''),
-                        dhcp=str(sensor_network_info.get('dhcp', '')),
-                        ipaddr=sensor_network_info.get('ipaddr', ''),
-                        ip_subnet=sensor_network_info.get('ip_subnet', ''),
-                        ip_gateway=sensor_network_info.get('ip_gateway', ''),
-                        dns1=sensor_network_info.get('dns1', ''),
-                        dns2=sensor_network_info.get('dns2', ''),
-                        wireless_network=sensor_network_info.get('wireless_network', '')
-                    ).info({})
-                    
-                    lldp_info = hardware_details.get('lldp_info', {}).get('lldp', {}).get('interface', {})
-                    
-                    for interface, lldp_data in lldp_info.items():
-                        chassis = lldp_data.get('chassis', {}).get('sw01', {})
-                        port = lldp_data.get('port', {})
-                        auto_negotiation = port.get('auto-negotiation', {})
-                        
-                        SENSOR_LLDP_INFO.labels(
-                            location_id=str(location_id),
-                            location_name=location_name,
-                            sensor_id=str(sensor_id),
-                            sensor_name=sensor_name,
-                            interface=interface,
-                            via=lldp_data.get('via', ''),
-                            age=lldp_data.get('age', ''),
-                            vlan_id=lldp_data.get('vlan', {}).get('vlan-id', ''),
-                            pvid=str(lldp_data.get('vlan', {}).get('pvid', '')),
-                            chassis_capability=chassis.get('capability', {}).get('type', ''),
-                            chassis_mgmt_ip=chassis.get('mgmt-ip', ''),
-                            chassis_id=chassis.get('id', {}).get('value', ''),
-                            chassis_descr=chassis.get('descr', ''),
-                            port_descr=port.get('descr', ''),
-                            port_id=port.get('id', {}).get('value', ''),
-                            auto_negotiation_current=auto_negotiation.get('current', '')
-                        ).info({})
-                        
-                    access_point_details = get_access_point_details(location_id=location_id, sensor_id=sensor_id).get('access_point_details', {}).get('data', [])
-                    
-                    for ap in access_point_details:
-                        ACCESS_POINT_DETAILS.labels(
-                            location_id=str(location_id),
-                            location_name=location_name,
-                            sensor_id=str(sensor_id),
-                            sensor_name=sensor_name,
-                            mac_address=ap.get('mac_address', ''),
-                            hostname=ap.get('hostname', ''),
-                            hostname_type_id=str(ap.get('hostname_type_id', '')),
-                            channel=ap.get('channel', ''),
-                            phy_type=ap.get('phy_type', ''),
-                            max_data_rate=ap.get('max_data_rate', ''),
-                            signal_strength=ap.get('signal_strength', ''),
-                            vendor=ap.get('vendor', ''),
-                            classification_type=str(ap.get('classification_type', ''))
-                        ).info({})
-                    
-                    client_details = get_client_details(location_id=location_id, sensor_id=sensor_id).get('client_details', {}).get('data', [])
-                    
-                    for client in client_details:
-                        CLIENT_DETAILS.labels(
-                            location_id=str(location_id),
-                            location_name=location_name,
-                            sensor_id=str(sensor_id),
-                            sensor_name=sensor_name,
-                            mac_address=client.get('mac_address', ''),
-                            hostname=client.get('hostname', ''),
-                            ssid=client.get('ssid', ''),
-                            bssid=client.get('bssid', ''),
-                            vendor=client.get('vendor', ''),
-                            phy_type=client.get('phy_type', ''),
-                            band_name=client.get('band_name', ''),
-                            channel=str(client.get('channel', ''))
-                        ).info({})
-                    
-                    ssid_details = get_ssid_details(location_id=location_id, sensor_id=sensor_id).get('ssid_details', {}).get('data', [])
-                    
-                    for ssid in ssid_details:
-                        for bssid in ssid.get('bssid_details_array', []):
-                            SSID_DETAILS.labels(
-                                location_id=str(location_id),
-                                location_name=location_name,
-                                sensor_id=str(sensor_id),
-                                sensor_name=sensor_name,
-                                ssid=ssid.get('ssid', ''),
-                                total_bssids=str(ssid.get('total_bssids', '')),
-                                security_name=ssid.get('security_name', ''),
-                                hidden_ssid=str(ssid.get('hidden_ssid', '')),
-                                bssid=bssid.get('bssid', ''),
-                                hostname=bssid.get('hostname', ''),
-                                hidden_bssid=str(bssid.get('hidden_bssid', '')),
-                                total_clients=bssid.get('total_clients', ''),
-                                channel=bssid.get('channel', ''),
-                                signal_strength=str(bssid.get('signal_strength', ''))
-                            ).info({})
-                    
-                    issue_details = get_issue_details(sensor_id).get('issue_details', {}).get('data', [])
-                    
-                    for issue in issue_details:
-                        ISSUE_DETAILS.labels(
-                            location_id=str(location_id),
-                            location_name=location_name,
-                            sensor_id=str(sensor_id),
-                            sensor_name=sensor_name,
-                            severity_name=issue.get('severity_name', ''),
-                            problem=issue.get('problem', ''),
-                            problem_description=issue.get('problem_description', ''),
-                            solution=issue.get('solution', '')
-                        ).info({})
-                    
-                    rf_analytics = get_rf_analytics(location_id=location_id, sensor_id=sensor_id).get('rf_details', {}).get('data', {})
-                    
-                    if isinstance(rf_analytics, list):
-                        for rf in rf_analytics:
-                            RF_ANALYTICS.labels(
-                                location_id=str(location_id),
-                                location_name=location_name,
-                                sensor_id=str(rf.get('sensor_id', '')),
-                                sensor_name=rf.get('sensor_name', ''),
-                                radio_id='radio1',
-                                channel=str(rf.get('channel_radio1', '')),
-                                airtime_total_percent=str(rf.get('airtime_percent_radio1', '')),
-                                mgmt_percent='',
-                                ctrl_percent='',
-                                data_percent='',
-                                others_percent='',
-                                available_percent='',
-                                noise='',
-                                client_mac_list='',
-                                client_hostname_list='',
-                                client_airtime_percentage=''
-                            ).info({})
-                            RF_ANALYTICS.labels(
-                                location_id=str(location_id),
-                                location_name=location_name,
-                                sensor_id=str(rf.get('sensor_id', '')),
-                                sensor_name=rf.get('sensor_name', ''),
-                                radio_id='radio2',
-                                channel=str(rf.get('channel_radio2', '')),
-                                airtime_total_percent=str(rf.get('airtime_percent_radio2', '')),
-                                mgmt_percent='',
-                                ctrl_percent='',
-                                data_percent='',
-                                others_percent='',
-                                available_percent='',
-                                noise='',
-                                client_mac_list='',
-                                client_hostname_list='',
-                                client_airtime_percentage=''
-                            ).info({})
-                    else:
-                        for radio_id, rf in rf_analytics.items():
-                            RF_ANALYTICS.labels(
-                                location_id=str(location_id),
-                                location_name=location_name,
-                                sensor_id=str(sensor_id),
-                                sensor_name=sensor_name,
-                                radio_id=radio_id,
-                                channel=str(rf.get('channel', '')),
-                                airtime_total_percent=str(rf.get('airtime_total_percent', '')),
-                                mgmt_percent=str(rf.get('mgmt_percent', '')),
-                                ctrl_percent=str(rf.get('ctrl_percent', '')),
-                                data_percent=str(rf.get('data_percent', '')),
-                                others_percent=str(rf.get('others_percent', '')),
-                                available_percent=str(rf.get('available_percent', '')),
-                                noise=str(rf.get('noise', '')),
-                                client_mac_list=','.join(rf.get('client_mac_list', [])),
-                                client_hostname_list=','.join(rf.get('client_hostname_list', [])),
-                                client_airtime_percentage=str(rf.get('client_airtime_percentage', ''))
-                            ).info({})
-                    
-                    client_distribution = get_client_distribution(location_id=location_id, sensor_id=sensor_id).get('client_distribution_list', {}).get('band_usage_array', [])
-                    client_distribution_data = get_client_distribution(location_id=location_id, sensor_id=sensor_id).get('client_distribution_list', {}).get('data', [])
-                    
-                    for dist in client_distribution:
-                        CLIENT_DISTRIBUTION.labels(
-                            location_id=str(location_id),
-                            location_name=location_name,
-                            sensor_id=str(sensor_id),
-                            sensor_name=sensor_name,
-                            band=dist.get('band', ''),
-                            total=str(dist.get('total', '')),
-                            percentage=dist.get('percentage', ''),
-                            mac_address='',
-                            hostname='',
-                            current_band='',
-                            capability_band='',
-                            category_id='',
-                            vendor='',
-                            ssid=''
-                        ).info({})
-                        
-                    for dist_data in client_distribution_data:
-                        CLIENT_DISTRIBUTION.labels(
-                            location_id=str(location_id),
-                            location_name=location_name,
-                            sensor_id=str(sensor_id),
-                            sensor_name=sensor_name,
-                            band='',
-                            total='',
-                            percentage='',
-                            mac_address=dist_data.get('mac_address', ''),
-                            hostname=dist_data.get('hostname', ''),
-                            current_band=dist_data.get('current_band', ''),
-                            capability_band=dist_data.get('capability_band', ''),
-                            category_id=str(dist_data.get('category_id', '')),
-                            vendor=dist_data.get('vendor', ''),
-                            ssid=dist_data.get('ssid', '')
-                        ).info({})
-                    
-                    network_test_profiles = get_network_test_profiles(location_id).get('network_test_profiles', {}).get('data', [])
-                    
-                    for profile in network_test_profiles:
-                        NETWORK_TEST_PROFILES.labels(
-                            location_id=str(location_id),
-                            location_name=location_name,
-                            network_test_profile_id=str(profile.get('network_test_profile_id', '')),
-                            network_test_profile_name=profile.get('network_test_profile_name', ''),
-                            network_test_suite_id=str(profile.get('network_test_suite_id', '')),
-                            network_test_suite_name=profile.get('network_test_suite_name', ''),
-                            ssid=profile.get('ssid', ''),
-                            schedule_type_id=str(profile.get('schedule_type_id', '')),
-                            schedule=profile.get('schedule', ''),
-                            enabled=str(profile.get('enabled', '')),
-                            is_valid=str(profile.get('is_valid', ''))
-                        ).info({})
-                    
-                    for profile in network_test_profiles:
-                        network_test_results = get_network_test_results(
-                            location_id=location_id,
-                            network_test_profile_id=profile.get('network_test_profile_id'),
-                            data_range_start_time="2021-02-21 00:40:00",
-                            data_range_end_time="2021-02-25 00:40:00"
-                        ).get('network_test_results', {}).get('data', [])
-                        
-                        for result in network_test_results:
-                            NETWORK_TEST_RESULTS.labels(
-                                location_id=str(location_id),
-                                location_name=location_name,
-                                sensor_id=str(result.get('sensor_id', '')),
-                                sensor_name=result.get('sensor_name', ''),
-                                network_test_profile_id=str(profile.get('network_test_profile_id', '')),
-                                network_test_profile_name=profile.get('network_test_profile_name', ''),
-                                network_test_suite_id=str(result.get('network_test_suite_id', '')),
-                                network_test_suite_name=result.get('network_test_suite_name', ''),
-                                result_status_id=str(result.get('result_status_id', '')),
-                                result_status_name=result.get('result_status_name', ''),
-                                start_time=str(result.get('start_time', '')),
-                                scheduled_time=result.get('scheduled_time', ''),
-                                execution_id=str(result.get('execution_id', ''))
-                            ).info({})
+            completed, failed, skipped, circuit_open = (sum(counts) for counts in zip(*results))
+            saved = sum(plan.saved for plan in plans)
+            API_CALLS_PLANNED.set(sum(len(plan.calls) for plan in plans))
+            API_CALLS_SAVED.set(saved)
+            for result, count in (('completed', completed), ('failed', failed), ('skipped', skipped), ('circuit_open', circuit_open)):
+                PASS_API_CALLS.labels(result=result).set(count)
+            spans = {}
+            for plan in plans:
+                plan.location_spans(spans)
+            for (org_name, location_id), (started, finished) in spans.items():
+                SERIES.context.org = org_name
+                set_gauge(LOCATION_PASS_DURATION, finished - started, location_id=str(location_id))
+            for org in ORGS:
+                if org.name in location_names:
+                    SENSOR_UPDATES.prune(org.name, location_names[org.name], sensors_by_location[org.name])
+                    LAST_TEST_RESULTS.prune(org.name, location_names[org.name], profiles_by_location[org.name])
+            if skipped:
+                logging.warning(f"Pass deadline of {PASS_DEADLINE_SECONDS}s reached; {skipped} API calls were not made")
             
-            logging.info("Metrics updated successfully")
+            for org in ORGS:
+                org.cache.save()
+                org.watermarks.save()
+            # A shard only counts as healthy when it knows all of its locations:
+            # every organization was listed, every location-level call worked
+            # and the pass finished within the deadline.
+            _, location_failed, location_skipped, location_circuit_open = (sum(counts) for counts in zip(list_results, location_results))
+            if not skipped and len(locations_by_org) == len(ORGS) and not (location_failed or location_skipped or location_circuit_open):
+                SHARD_LAST_SUCCESS.labels(shard_index=SHARD_INDEX, shard_count=SHARD_COUNT).set_to_current_time()
+            
+            logging.info(f"Metrics updated successfully ({completed} API calls succeeded, {failed} failed, {circuit_open} skipped by open circuits, {saved} saved by deduplication)")
         except Exception as e:
             logging.error(f"Error collecting metrics: {e}")
+        with PASS_PHASE_DURATION.labels(phase='finish').time():
+            for org in ORGS:
+                org.scheduler.end_pass()
+            SERIES.end_pass()
+            COLLECTOR.refresh()
+            EXPOSITION.refresh()
+    PROFILER.stop()
 
-if __name__ == '__main__':
-    # Start up the server to expose the metrics.
-    start_http_server(8000)
-    logging.info("Starting HTTP server on port 8000")
-    # Continuously collect metrics every 60 seconds.
+def run_schedule():
+    # Passes start on a fixed grid of ticks rather than sleeping a fixed time
+    # after each pass, so the period doesn't drift by the pass duration. Ticks
+    # missed while a pass overran are skipped and counted.
+    next_tick = time.time()
     while True:
+        SCHEDULE_PASS_LAG.set(max(time.time() - next_tick, 0))
         collect_metrics()
-        time.sleep(60)
+        ticks = int((time.time() - next_tick) // SCHEDULE_TICK_SECONDS) + 1
+        if ticks > 1:
+            SCHEDULE_OVERRUNS.inc(ticks - 1)
+            logging.warning(f"Collection pass overran {ticks - 1} scheduler ticks")
+        next_tick += ticks * SCHEDULE_TICK_SECONDS
+        time.sleep(max(next_tick - time.time(), 0))
+
+if __name__ == '__main__':
+    for org in ORGS:
+        org.cache.load()
+        org.watermarks.load()
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, PROFILER.handle_signal)
+        signal.signal(signal.SIGUSR2, PROFILER.handle_signal)
+    # Start up the server to expose the metrics.
+    start_metrics_server(METRICS_PORT)
+    logging.info(f"Starting HTTP server on port {METRICS_PORT}")
+    # Continuously collect metrics on the polling schedule.
+    run_schedule()
@@ -0,0 +1,135 @@
+import argparse
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from urllib.request import urlopen
+
+from mock_wyebot_api import add_fleet_arguments
+
+# Runs collect_metrics() against mock_wyebot_api.py and reports pass wall time,
+# API calls, time spent fetching, decoding and writing, peak RSS and the cost
+# and size of the cached /metrics rendering. The mock runs in its own process so its synthetic fleet doesn't
+# count towards the exporter's memory.
+
+FLEET_ARGUMENTS = ['locations', 'sensors_per_location', 'clients_per_sensor', 'aps_per_sensor', 'radios_per_sensor',
+                   'ssids_per_location', 'issues_per_sensor', 'profiles_per_location', 'latency_ms',
+                   'latency_jitter_ms', 'error_rate', 'throttle_rate', 'seed']
+
+def start_mock(args):
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_wyebot_api.py'), '--port', '0']
+    for name in FLEET_ARGUMENTS:
+        command += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    base_url = process.stdout.readline().strip()
+    if not base_url:
+        process.kill()
+        raise RuntimeError('Mock Wyebot API failed to start')
+    return process, base_url
+
+def mock_control(base_url, action):
+    root = base_url.rsplit('/external_api', 1)[0]
+    with urlopen(f"{root}/_mock/{action}") as response:
+        return json.load(response)
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def phase_seconds(histogram):
+    # Summed over endpoints: {'fetch': ..., 'decode': ..., 'write': ...}
+    seconds = {}
+    for metric in histogram.collect():
+        for sample in metric.samples:
+            if sample.name.endswith('_sum'):
+                seconds[sample.labels['phase']] = seconds.get(sample.labels['phase'], 0) + sample.value
+    return seconds
+
+def run_benchmark(args, base_url):
+    # app reads its configuration at import time, so the environment has to be
+    # in place before it is imported.
+    os.environ['WYEBOT_BASE_URL'] = base_url
+    for assignment in args.env:
+        name, value = assignment.split('=', 1)
+        os.environ[name] = value
+    import app
+    from prometheus_client import REGISTRY
+
+    results = []
+    for number in range(1, args.passes + 1):
+        # Every pass polls the whole fleet; the schedule would otherwise skip
+        # everything that isn't due yet.
+        for org in app.ORGS:
+            org.scheduler.next_due.clear()
+        writes = REGISTRY.get_sample_value('wyebot_series_writes_total')
+        write_seconds = REGISTRY.get_sample_value('wyebot_write_seconds_total')
+        phases = phase_seconds(app.CALL_PHASE_DURATION)
+        mock_control(base_url, 'reset')
+        start = time.perf_counter()
+        app.collect_metrics()
+        wall_time = time.perf_counter() - start
+        stats = mock_control(base_url, 'stats')
+        writes = REGISTRY.get_sample_value('wyebot_series_writes_total') - writes
+        write_seconds = REGISTRY.get_sample_value('wyebot_write_seconds_total') - write_seconds
+        phases = {phase: seconds - phases.get(phase, 0) for phase, seconds in phase_seconds(app.CALL_PHASE_DURATION).items()}
+
+        # The same rendering collect_metrics() caches for /metrics at the end of a pass.
+        start = time.perf_counter()
+        rendering = app.Rendering(list(app.COLLECTOR.collect()))
+        render_time = time.perf_counter() - start
+
+        results.append({
+            'pass': number,
+            'wall_time_seconds': wall_time,
+            'api_calls': sum(stats['calls'].values()),
+            'api_calls_by_endpoint': stats['calls'],
+            'api_bytes': stats['bytes_sent'],
+            'series_writes': int(writes),
+            'write_seconds': write_seconds,
+            'fetch_seconds': phases.get('fetch', 0),
+            'decode_seconds': phases.get('decode', 0),
+            'peak_rss_mb': peak_rss_mb(),
+            'render_time_seconds': render_time,
+            'payload_bytes': len(rendering.body),
+            'gzipped_payload_bytes': len(rendering.gzipped),
+        })
+    return results
+
+def print_results(results):
+    print(f"{'pass':>4} {'wall s':>9} {'calls':>7} {'API MB':>8} {'fetch s':>8} {'decode s':>9} {'writes':>8} {'us/write':>9} {'peak RSS MB':>12} {'render s':>9} {'payload MB':>11} {'gzipped MB':>11}")
+    for result in results:
+        # Phase times are summed over the collector threads, so they can exceed the wall time.
+        per_write = result['write_seconds'] / result['series_writes'] * 1e6 if result['series_writes'] else 0
+        print(f"{result['pass']:>4} {result['wall_time_seconds']:>9.3f} {result['api_calls']:>7} "
+              f"{result['api_bytes'] / 1e6:>8.2f} {result['fetch_seconds']:>8.3f} {result['decode_seconds']:>9.3f} {result['series_writes']:>8} {per_write:>9.2f} {result['peak_rss_mb']:>12.1f} "
+              f"{result['render_time_seconds']:>9.3f} {result['payload_bytes'] / 1e6:>11.2f} {result['gzipped_payload_bytes'] / 1e6:>11.2f}")
+    print(f"median wall time {statistics.median(r['wall_time_seconds'] for r in results):.3f}s, "
+          f"median render time {statistics.median(r['render_time_seconds'] for r in results):.3f}s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark collect_metrics() against a local mock Wyebot API')
+    parser.add_argument('--passes', type=int, default=3)
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='Exporter setting to apply before app.py is imported, e.g. WYEBOT_BULK_FETCH=true')
+    parser.add_argument('--json', help='Write the configuration and per-pass results to this file')
+    parser.add_argument('--verbose', action='store_true', help="Keep the exporter's INFO logging")
+    add_fleet_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    process, base_url = start_mock(args)
+    try:
+        results = run_benchmark(args, base_url)
+    finally:
+        process.terminate()
+        process.wait()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'fleet': {name: getattr(args, name) for name in FLEET_ARGUMENTS}, 'env': args.env, 'results': results}, f, indent=2)
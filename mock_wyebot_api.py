@@ -0,0 +1,471 @@
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-in for the Wyebot external API, serving a synthetic organization
+# with the same response shapes app.py parses.
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+TEST_RESULT_INTERVAL_SECONDS = 900
+BANDS = ['2.4GHz', '5GHz', '6GHz']
+PHY_TYPES = ['802.11n', '802.11ac', '802.11ax']
+VENDORS = ['Apple', 'Samsung', 'Intel', 'Cisco', 'Aruba', 'Dell']
+SEVERITIES = ['Critical', 'Major', 'Minor']
+
+def random_mac(rng):
+    return ':'.join(f'{rng.randint(0, 255):02x}' for _ in range(6))
+
+class SyntheticFleet:
+    def __init__(self, locations=5, sensors_per_location=10, clients_per_sensor=50, aps_per_sensor=10,
+                 radios_per_sensor=2, ssids_per_location=4, issues_per_sensor=3, profiles_per_location=2, seed=1):
+        rng = random.Random(seed)
+        self.locations = []
+        self.sensors = {}
+        self.profiles = {}
+        sensor_id = 1000
+        profile_id = 1
+        for location_index in range(locations):
+            location_id = 100 + location_index
+            location = {'location_id': location_id, 'location_name': f'Location {location_index + 1}', 'sensors': []}
+            ssids = [f'ssid-{location_index + 1}-{n + 1}' for n in range(ssids_per_location)]
+            for sensor_index in range(sensors_per_location):
+                sensor_id += 1
+                sensor = self._build_sensor(rng, location_id, sensor_id, f'sensor-{location_index + 1}-{sensor_index + 1}',
+                                            ssids, clients_per_sensor, aps_per_sensor, radios_per_sensor, issues_per_sensor)
+                location['sensors'].append(sensor)
+                self.sensors[sensor_id] = sensor
+            for profile_index in range(profiles_per_location):
+                profile = {
+                    'network_test_profile_id': profile_id,
+                    'network_test_profile_name': f'Profile {profile_id}',
+                    'network_test_suite_id': 10 + profile_index,
+                    'network_test_suite_name': f'Suite {profile_index + 1}',
+                    'ssid': ssids[profile_index % len(ssids)] if ssids else '',
+                    'schedule_type_id': 1,
+                    'schedule': 'Every 15 minutes',
+                    'enabled': True,
+                    'is_valid': True,
+                }
+                self.profiles.setdefault(location_id, []).append(profile)
+                profile_id += 1
+            self.locations.append(location)
+        self.locations_by_id = {location['location_id']: location for location in self.locations}
+
+    def _build_sensor(self, rng, location_id, sensor_id, sensor_name, ssids, clients, aps, radios, issues):
+        ap_rows = []
+        for _ in range(aps):
+            ap_rows.append({
+                'mac_address': random_mac(rng),
+                'hostname': f'ap-{rng.randint(1, 9999)}',
+                'hostname_type_id': 1,
+                'channel': str(rng.choice([1, 6, 11, 36, 44, 149])),
+                'phy_type': rng.choice(PHY_TYPES),
+                'max_data_rate': f'{rng.choice([144, 866, 1201])} Mbps',
+                'signal_strength': f'{rng.randint(-90, -30)} dBm',
+                'vendor': rng.choice(VENDORS),
+                'classification_type': rng.randint(1, 3),
+            })
+        client_rows = []
+        for _ in range(clients):
+            ap = rng.choice(ap_rows) if ap_rows else {}
+            client_rows.append({
+                'mac_address': random_mac(rng),
+                'hostname': f'client-{rng.randint(1, 99999)}',
+                'ssid': rng.choice(ssids) if ssids else '',
+                'bssid': ap.get('mac_address', ''),
+                'vendor': rng.choice(VENDORS),
+                'phy_type': rng.choice(PHY_TYPES),
+                'band_name': rng.choice(BANDS),
+                'channel': rng.choice([1, 6, 11, 36, 44, 149]),
+                'current_band': rng.choice(BANDS),
+                'capability_band': rng.choice(BANDS),
+                'category_id': rng.randint(1, 5),
+            })
+        ssid_rows = []
+        for ssid in ssids:
+            bssids = [ap for ap in ap_rows if rng.random() < 0.5] or ap_rows[:1]
+            ssid_rows.append({
+                'ssid': ssid,
+                'total_bssids': len(bssids),
+                'security_name': 'WPA2-Enterprise',
+                'hidden_ssid': False,
+                'bssid_details_array': [{
+                    'bssid': ap['mac_address'],
+                    'hostname': ap['hostname'],
+                    'hidden_bssid': False,
+                    'total_clients': str(sum(1 for client in client_rows if client['bssid'] == ap['mac_address'])),
+                    'channel': ap['channel'],
+                    'signal_strength': int(ap['signal_strength'].split()[0]),
+                } for ap in bssids],
+            })
+        radio_rows = {}
+        for radio_index in range(radios):
+            airtime = rng.randint(5, 90)
+            radio_clients = rng.sample(client_rows, min(len(client_rows), 5))
+            radio_rows[f'radio{radio_index + 1}'] = {
+                'channel': rng.choice([1, 6, 11, 36, 44, 149]),
+                'airtime_total_percent': airtime,
+                'mgmt_percent': rng.randint(0, 10),
+                'ctrl_percent': rng.randint(0, 10),
+                'data_percent': rng.randint(0, airtime),
+                'others_percent': rng.randint(0, 5),
+                'available_percent': 100 - airtime,
+                'noise': rng.randint(-100, -80),
+                'client_mac_list': [client['mac_address'] for client in radio_clients],
+                'client_hostname_list': [client['hostname'] for client in radio_clients],
+                'client_airtime_percentage': rng.randint(0, 50),
+            }
+        issue_rows = [{
+            'severity_name': rng.choice(SEVERITIES),
+            'problem': f'Problem {n + 1}',
+            'problem_description': f'Synthetic problem {n + 1} on {sensor_name}',
+            'solution': 'Check the configuration',
+        } for n in range(issues)]
+        lldp = {'eth0': {
+            'via': 'LLDP',
+            'age': '1 day, 02:03:04',
+            'vlan': {'vlan-id': '10', 'pvid': 'yes'},
+            'chassis': {'sw01': {
+                'capability': {'type': 'Bridge'},
+                'mgmt-ip': f'10.0.{location_id % 256}.1',
+                'id': {'value': random_mac(rng)},
+                'descr': 'Synthetic switch',
+            }},
+            'port': {'descr': 'GigabitEthernet1/0/1', 'id': {'value': 'Gi1/0/1'}, 'auto-negotiation': {'current': '1000BaseTFD'}},
+        }}
+        return {
+            'sensor_id': sensor_id,
+            'sensor_name': sensor_name,
+            'location_id': location_id,
+            'info': {'hardware_details': {
+                'specification': {
+                    'model': 'WyeBOT-M1',
+                    'serial_number': f'SN{sensor_id:08d}',
+                    'wireless_mac_address': random_mac(rng),
+                    'wired_mac_address': random_mac(rng),
+                    'link_speed': '1000 Mbps',
+                    'power_source': 'PoE',
+                },
+                'service': {
+                    'uptime': str(rng.randint(1000, 10000000)),
+                    'software_version': '5.2.1',
+                    'license_info': 'Enterprise',
+                },
+                'lldp_info': {'lldp': {'interface': lldp}},
+            }},
+            'network_info': {
+                'connection_type': 'wired',
+                'dhcp': True,
+                'ipaddr': f'10.0.{location_id % 256}.{sensor_id % 250 + 2}',
+                'ip_subnet': '255.255.255.0',
+                'ip_gateway': f'10.0.{location_id % 256}.1',
+                'dns1': '8.8.8.8',
+                'dns2': '8.8.4.4',
+                'wireless_network': '',
+            },
+            'access_points': ap_rows,
+            'clients': client_rows,
+            'ssids': ssid_rows,
+            'radios': radio_rows,
+            'issues': issue_rows,
+        }
+
+    def sensors_for(self, location_id=None, sensor_id=None):
+        if sensor_id is not None:
+            sensor = self.sensors.get(sensor_id)
+            return [sensor] if sensor else []
+        if location_id is not None:
+            location = self.locations_by_id.get(location_id)
+            return location['sensors'] if location else []
+        return list(self.sensors.values())
+
+    def test_results(self, location_id, profile_id, start, end):
+        location = self.locations_by_id.get(location_id)
+        profile = next((p for p in self.profiles.get(location_id, []) if p['network_test_profile_id'] == profile_id), None)
+        if not location or not profile or not location['sensors']:
+            return []
+        now = time.time()
+        end = min(end, now)
+        rows = []
+        slot = int(start // TEST_RESULT_INTERVAL_SECONDS) + 1
+        while slot * TEST_RESULT_INTERVAL_SECONDS <= end:
+            timestamp = slot * TEST_RESULT_INTERVAL_SECONDS
+            sensor = location['sensors'][slot % len(location['sensors'])]
+            passed = (slot + profile_id) % 7 != 0
+            rows.append({
+                'sensor_id': sensor['sensor_id'],
+                'sensor_name': sensor['sensor_name'],
+                'network_test_suite_id': profile['network_test_suite_id'],
+                'network_test_suite_name': profile['network_test_suite_name'],
+                'result_status_id': 1 if passed else 2,
+                'result_status_name': 'Pass' if passed else 'Fail',
+                'start_time': datetime.fromtimestamp(timestamp, timezone.utc).strftime(TIME_FORMAT),
+                'scheduled_time': datetime.fromtimestamp(timestamp, timezone.utc).strftime(TIME_FORMAT),
+                'execution_id': slot * 1000 + profile_id,
+            })
+            slot += 1
+        return rows
+
+class MockWyebotAPI:
+    def __init__(self, fleet, latency_ms=0.0, latency_jitter_ms=0.0, error_rate=0.0, throttle_rate=0.0,
+                 api_key=None, seed=1):
+        self.fleet = fleet
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.api_key = api_key
+        self.calls = Counter()
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/external_api'
+
+    def reset_counters(self):
+        with self.lock:
+            self.calls.clear()
+            self.bytes_sent = 0
+
+    def start(self, host='127.0.0.1', port=0):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self.handle_request({})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode() if length else ''
+                self.handle_request({key: values[0] for key, values in parse_qs(body).items()})
+
+            def handle_request(self, params):
+                path = urlparse(self.path).path
+                status, payload = api.dispatch(path, params, self.headers)
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                self.end_headers()
+                self.wfile.write(body)
+                if not path.startswith('/_mock/'):
+                    with api.lock:
+                        api.bytes_sent += len(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def stats(self):
+        with self.lock:
+            return {'calls': dict(self.calls), 'bytes_sent': self.bytes_sent}
+
+    def dispatch(self, path, params, headers):
+        # Control endpoints used by benchmark.py when the mock runs in its own process.
+        if path == '/_mock/stats':
+            return 200, self.stats()
+        if path == '/_mock/reset':
+            stats = self.stats()
+            self.reset_counters()
+            return 200, stats
+        endpoint = path.split('/external_api', 1)[-1]
+        with self.lock:
+            self.calls[endpoint] += 1
+            roll = self.rng.random()
+            delay = max(self.latency_ms + self.rng.uniform(-self.latency_jitter_ms, self.latency_jitter_ms), 0) / 1000
+        if delay:
+            time.sleep(delay)
+        if self.api_key is not None and headers.get('api_key') != self.api_key:
+            return 401, {'error': 'invalid api key'}
+        if roll < self.throttle_rate:
+            return 429, {'error': 'too many requests'}
+        if roll < self.throttle_rate + self.error_rate:
+            return 500, {'error': 'internal error'}
+        handler = ENDPOINTS.get(endpoint)
+        if handler is None:
+            return 404, {'error': f'unknown endpoint {endpoint}'}
+        return 200, handler(self.fleet, params)
+
+def int_param(params, name):
+    value = params.get(name)
+    return int(value) if value not in (None, '') else None
+
+def parse_time(value):
+    return datetime.strptime(value, TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+
+def handle_locations(fleet, params):
+    return {'location_details': {'data': [
+        {'location_id': location['location_id'], 'location_name': location['location_name']}
+        for location in fleet.locations
+    ]}}
+
+def handle_sensors(fleet, params):
+    return {'sensor_details': {'data': [
+        {'sensor_id': sensor['sensor_id'], 'sensor_name': sensor['sensor_name']}
+        for sensor in fleet.sensors_for(location_id=int_param(params, 'location_id'))
+    ]}}
+
+def handle_sensor_info(fleet, params):
+    sensors = fleet.sensors_for(sensor_id=int_param(params, 'sensor_id'))
+    return {'sensor_info': {'data': sensors[0]['info'] if sensors else {}}}
+
+def handle_sensor_network_info(fleet, params):
+    sensors = fleet.sensors_for(sensor_id=int_param(params, 'sensor_id'))
+    return {'sensor_network_info': {'data': sensors[0]['network_info'] if sensors else {}}}
+
+def dashboard_rows(fleet, params, key, tag_sensor=True):
+    sensor_id = int_param(params, 'sensor_id')
+    sensors = fleet.sensors_for(location_id=int_param(params, 'location_id'), sensor_id=sensor_id)
+    rows = []
+    for sensor in sensors:
+        for row in sensor[key]:
+            # Location-wide responses carry the reporting sensor so callers can split them.
+            rows.append(dict(row, sensor_id=sensor['sensor_id']) if tag_sensor and sensor_id is None else row)
+    return rows
+
+def handle_access_points(fleet, params):
+    return {'access_point_details': {'data': dashboard_rows(fleet, params, 'access_points')}}
+
+def handle_clients(fleet, params):
+    return {'client_details': {'data': dashboard_rows(fleet, params, 'clients')}}
+
+def handle_ssids(fleet, params):
+    # SSID rows are aggregated per location and never identify a single sensor.
+    return {'ssid_details': {'data': dashboard_rows(fleet, params, 'ssids', tag_sensor=False)}}
+
+def handle_issues(fleet, params):
+    return {'issue_details': {'data': dashboard_rows(fleet, params, 'issues')}}
+
+def handle_rf_analytics(fleet, params):
+    sensor_id = int_param(params, 'sensor_id')
+    sensors = fleet.sensors_for(location_id=int_param(params, 'location_id'), sensor_id=sensor_id)
+    if sensor_id is not None:
+        return {'rf_details': {'data': sensors[0]['radios'] if sensors else {}}}
+    rows = []
+    for sensor in sensors:
+        row = {'sensor_id': sensor['sensor_id'], 'sensor_name': sensor['sensor_name']}
+        for radio_id, radio in sensor['radios'].items():
+            row[f'channel_{radio_id}'] = radio['channel']
+            row[f'airtime_percent_{radio_id}'] = radio['airtime_total_percent']
+        rows.append(row)
+    return {'rf_details': {'data': rows}}
+
+def handle_client_distribution(fleet, params):
+    clients = dashboard_rows(fleet, params, 'clients')
+    bands = Counter(client['current_band'] for client in clients)
+    return {'client_distribution_list': {
+        'band_usage_array': [{
+            'band': band,
+            'total': total,
+            'percentage': f'{100 * total / len(clients):.1f}',
+        } for band, total in sorted(bands.items())],
+        'data': [{key: client[key] for key in ('mac_address', 'hostname', 'current_band', 'capability_band',
+                                               'category_id', 'vendor', 'ssid', 'sensor_id') if key in client}
+                 for client in clients],
+    }}
+
+def handle_test_profiles(fleet, params):
+    return {'network_test_profiles': {'data': fleet.profiles.get(int_param(params, 'location_id'), [])}}
+
+def handle_test_results(fleet, params):
+    rows = fleet.test_results(
+        int_param(params, 'location_id'),
+        int_param(params, 'network_test_profile_id'),
+        parse_time(params['data_range_start_time']),
+        parse_time(params['data_range_end_time']),
+    )
+    return {'network_test_results': {'data': rows}}
+
+ENDPOINTS = {
+    '/org/get_locations': handle_locations,
+    '/org/get_sensors': handle_sensors,
+    '/org/get_sensor_info': handle_sensor_info,
+    '/org/get_sensor_network_info': handle_sensor_network_info,
+    '/dashboard/accesspointlist': handle_access_points,
+    '/dashboard/clientlist': handle_clients,
+    '/dashboard/ssidlist': handle_ssids,
+    '/dashboard/sensor_issues': handle_issues,
+    '/dashboard/rf_analytics': handle_rf_analytics,
+    '/dashboard/clientdistributionlist': handle_client_distribution,
+    '/test/get_network_test_profiles': handle_test_profiles,
+    '/test/get_network_test_results': handle_test_results,
+}
+
+def add_fleet_arguments(parser):
+    parser.add_argument('--locations', type=int, default=5)
+    parser.add_argument('--sensors-per-location', type=int, default=10)
+    parser.add_argument('--clients-per-sensor', type=int, default=50)
+    parser.add_argument('--aps-per-sensor', type=int, default=10)
+    parser.add_argument('--radios-per-sensor', type=int, default=2)
+    parser.add_argument('--ssids-per-location', type=int, default=4)
+    parser.add_argument('--issues-per-sensor', type=int, default=3)
+    parser.add_argument('--profiles-per-location', type=int, default=2)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--latency-jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+
+def build_mock_api(args):
+    fleet = SyntheticFleet(
+        locations=args.locations,
+        sensors_per_location=args.sensors_per_location,
+        clients_per_sensor=args.clients_per_sensor,
+        aps_per_sensor=args.aps_per_sensor,
+        radios_per_sensor=args.radios_per_sensor,
+        ssids_per_location=args.ssids_per_location,
+        issues_per_sensor=args.issues_per_sensor,
+        profiles_per_location=args.profiles_per_location,
+        seed=args.seed,
+    )
+    return MockWyebotAPI(
+        fleet,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed,
+    )
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Serve a synthetic Wyebot organization for local testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    add_fleet_arguments(parser)
+    args = parser.parse_args()
+    api = build_mock_api(args).start(args.host, args.port)
+    # The first line on stdout is the base URL, so callers can start the mock on port 0.
+    print(api.base_url, flush=True)
+    logging.info(f"Mock Wyebot API listening on {api.base_url} with {len(api.fleet.locations)} locations and {len(api.fleet.sensors)} sensors")
+    try:
+        api.thread.join()
+    except KeyboardInterrupt:
+        api.stop()
@@ -0,0 +1,75 @@
+import logging
+
+import pytest
+import requests
+from prometheus_client import REGISTRY
+
+import app
+
+logging.disable(logging.CRITICAL)
+
+ENDPOINT = ('endpoint', '/dashboard/clientlist')
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(app.time, 'monotonic', lambda: now[0])
+    return now
+
+def test_circuit_opens_at_threshold_and_half_opens_after_cooldown(clock):
+    breaker = app.CircuitBreaker('breaker', threshold=2, cooldown=60)
+    scopes = [ENDPOINT]
+    breaker.record_failure(scopes)
+    assert breaker.allow(scopes)
+    breaker.record_failure(scopes)
+    assert not breaker.allow(scopes)
+    clock[0] += 61
+    # One trial call is let through; concurrent callers are still skipped.
+    assert breaker.allow(scopes)
+    assert not breaker.allow(scopes)
+    breaker.record_failure(scopes)
+    assert not breaker.allow(scopes)
+    clock[0] += 61
+    assert breaker.allow(scopes)
+    breaker.record_success(scopes)
+    assert breaker.allow(scopes) and breaker.allow(scopes)
+
+def test_open_sensor_circuit_only_skips_that_sensor(clock):
+    breaker = app.CircuitBreaker('breaker', threshold=1, cooldown=60)
+    breaker.record_failure(breaker.scopes('/dashboard/clientlist', {'sensor_id': 1}))
+    assert not breaker.allow(breaker.scopes('/dashboard/clientlist', {'sensor_id': 1}))
+    assert not breaker.allow(breaker.scopes('/dashboard/clientlist', {'sensor_id': 2}))
+    breaker.record_success([ENDPOINT])
+    assert breaker.allow(breaker.scopes('/dashboard/clientlist', {'sensor_id': 2}))
+    assert not breaker.allow(breaker.scopes('/dashboard/clientlist', {'sensor_id': 1}))
+
+class BrokenStream:
+    status_code = 200
+    headers = {}
+
+    def iter_content(self, size):
+        yield b'{"client_details": {"data": [{"sensor_id": 1, "mac_address": "a"}, '
+        raise requests.exceptions.ChunkedEncodingError('connection reset')
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+def test_streamed_read_errors_count_against_the_endpoint(monkeypatch):
+    pytest.importorskip('ijson')
+    breaker = app.CircuitBreaker('stream', threshold=1, cooldown=60)
+    client = app.WyebotClient('stream', 'http://wyebot.invalid', 'k', breaker=breaker, projections=app.STREAM_PROJECTIONS)
+    monkeypatch.setattr(client.session, 'request', lambda *args, **kwargs: BrokenStream())
+    labels = {'org': 'stream', 'endpoint': '/dashboard/clientlist'}
+    response = app.get_client_details(client, location_id=1)
+    # Nothing is recorded until the rows have been read.
+    assert REGISTRY.get_sample_value('wyebot_api_requests_total', dict(labels, result='success')) is None
+    rows = response['client_details']['data']
+    assert next(rows)['mac_address'] == 'a'
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        list(rows)
+    assert REGISTRY.get_sample_value('wyebot_api_requests_total', dict(labels, result='error')) == 1
+    assert REGISTRY.get_sample_value('wyebot_api_requests_total', dict(labels, result='success')) is None
+    assert not breaker.allow(breaker.scopes('/dashboard/clientlist', {'location_id': 1}))
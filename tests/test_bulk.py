@@ -0,0 +1,68 @@
+import logging
+
+import pytest
+
+import app
+
+logging.disable(logging.CRITICAL)
+
+ORG = app.ORGS[0]
+
+class FakeOrg:
+    def __init__(self, name):
+        self.name = name
+
+@pytest.fixture(autouse=True)
+def series_context():
+    app.SERIES.context.org = ORG.name
+    app.SERIES.context.max_age = 0
+
+@pytest.fixture
+def recording_writer(monkeypatch):
+    written = []
+    def write_rows(response, location_id, location_name, sensor_id, sensor_name):
+        rows = response['rows']['data']
+        if any(row.get('bad') for row in rows):
+            raise TypeError('malformed row')
+        written.append((sensor_id, [row['value'] for row in rows]))
+    monkeypatch.setitem(app.BULK_ENDPOINTS, app.get_ssid_details, ('rows', write_rows))
+    monkeypatch.setattr(app, 'UNSPLITTABLE_ENDPOINTS', {})
+    return written
+
+def test_write_bulk_splits_rows_by_sensor(recording_writer):
+    response = {'rows': {'data': [{'sensor_id': 1, 'value': 'a'}, {'sensor_id': '2', 'value': 'b'}, {'sensor_id': 1, 'value': 'c'}]}}
+    fallbacks = []
+    app.write_bulk(response, app.get_ssid_details, ORG, 10, 'loc', {1: 's1', 2: 's2', 3: 's3'}, fallbacks)
+    assert recording_writer == [(1, ['a', 'c']), (2, ['b']), (3, [])]
+    assert fallbacks == []
+
+def test_write_bulk_accepts_streamed_rows(recording_writer):
+    response = {'rows': {'data': (row for row in [{'sensor_id': 1, 'value': 'a'}])}}
+    app.write_bulk(response, app.get_ssid_details, ORG, 10, 'loc', {1: 's1'}, [])
+    assert recording_writer == [(1, ['a'])]
+
+def test_write_bulk_falls_back_without_sensor_id(recording_writer):
+    response = {'rows': {'data': [{'sensor_id': 1, 'value': 'a'}, {'value': 'b'}]}}
+    fallbacks = []
+    app.write_bulk(response, app.get_ssid_details, ORG, 10, 'loc', {1: 's1'}, fallbacks)
+    assert recording_writer == []
+    assert fallbacks == [(ORG, 10, app.get_ssid_details)]
+    assert app.unsplittable(ORG, app.get_ssid_details)
+    # Other organizations keep using the location-wide call.
+    assert not app.unsplittable(FakeOrg('other'), app.get_ssid_details)
+
+def test_unsplittable_endpoint_is_probed_again(recording_writer, monkeypatch):
+    monkeypatch.setattr(app.time, 'time', lambda: 1000.0)
+    app.write_bulk({'rows': {'data': [{'value': 'b'}]}}, app.get_ssid_details, ORG, 10, 'loc', {1: 's1'}, [])
+    assert app.unsplittable(ORG, app.get_ssid_details)
+    monkeypatch.setattr(app.time, 'time', lambda: 1000.0 + app.BULK_REPROBE_SECONDS)
+    assert not app.unsplittable(ORG, app.get_ssid_details)
+    assert app.UNSPLITTABLE_ENDPOINTS == {}
+
+def test_write_bulk_isolates_malformed_sensor(recording_writer):
+    errors = app.PROCESSING_ERRORS.labels(writer='write_rows')
+    before = errors._value.get()
+    response = {'rows': {'data': [{'sensor_id': 1, 'value': 'a', 'bad': True}, {'sensor_id': 2, 'value': 'b'}]}}
+    app.write_bulk(response, app.get_ssid_details, ORG, 10, 'loc', {1: 's1', 2: 's2'}, [])
+    assert recording_writer == [(2, ['b'])]
+    assert errors._value.get() == before + 1
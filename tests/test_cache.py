@@ -0,0 +1,84 @@
+import logging
+
+import pytest
+import requests
+from prometheus_client import REGISTRY
+
+import app
+from mock_wyebot_api import MockWyebotAPI, SyntheticFleet
+
+logging.disable(logging.CRITICAL)
+
+TTLS = {'/org/get_sensors': 300}
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(app.time, 'time', lambda: now[0])
+    return now
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = app.ResponseCache('ttl', TTLS, stale_if_error=600)
+    key = cache.key('/org/get_sensors', {'location_id': 1})
+    cache.put(key, {'ok': True})
+    clock[0] += 300
+    assert cache.get(key) == {'ok': True}
+    clock[0] += 1
+    assert cache.get(key) is None
+    assert cache.get_stale(key) == {'ok': True}
+    clock[0] += 600
+    assert cache.get_stale(key) is None
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = app.ResponseCache('lru', TTLS, max_entries=2)
+    keys = [cache.key('/org/get_sensors', {'location_id': location_id}) for location_id in range(3)]
+    cache.put(keys[0], 0)
+    cache.put(keys[1], 1)
+    assert cache.get(keys[0]) == 0
+    cache.put(keys[2], 2)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == 0 and cache.get(keys[2]) == 2
+    assert REGISTRY.get_sample_value('wyebot_cache_evictions_total', {'org': 'lru'}) == 1
+
+def test_stale_response_is_served_when_refresh_fails(clock):
+    api = MockWyebotAPI(SyntheticFleet(locations=1, sensors_per_location=2), api_key='k').start()
+    try:
+        cache = app.ResponseCache('stale', TTLS, stale_if_error=600)
+        client = app.WyebotClient('stale', api.base_url, 'k', max_retries=0, cache=cache)
+        location_id = api.fleet.locations[0]['location_id']
+        fresh = app.get_sensors(client, location_id)
+        assert app.get_sensors(client, location_id) == fresh
+        assert api.calls['/org/get_sensors'] == 1
+        api.error_rate = 1.0
+        clock[0] += 301
+        assert app.get_sensors(client, location_id) == fresh
+        assert REGISTRY.get_sample_value('wyebot_cache_stale_hits_total', {'org': 'stale', 'endpoint': '/org/get_sensors'}) == 1
+        clock[0] += 600
+        with pytest.raises(requests.HTTPError):
+            app.get_sensors(client, location_id)
+    finally:
+        api.stop()
+
+@pytest.mark.parametrize('content', ['{"not": "a list"}', '[1, 2]', '[["/org/get_sensors", 5, 0, {}]]', '[[["x"], [], 0, {}]]'])
+def test_cache_ignores_file_of_wrong_shape(tmp_path, content):
+    path = tmp_path / 'cache.json'
+    path.write_text(content)
+    cache = app.ResponseCache('o', {'/org/get_sensors': 300}, path=str(path))
+    cache.load()
+    assert len(cache.entries) == 0
+
+def test_cache_round_trip_and_saves_only_changes(tmp_path):
+    path = tmp_path / 'cache.json'
+    cache = app.ResponseCache('o', {'/org/get_sensors': 300}, path=str(path))
+    key = cache.key('/org/get_sensors', {'location_id': 1})
+    cache.put(key, {'ok': True})
+    cache.save()
+    loaded = app.ResponseCache('o', {'/org/get_sensors': 300}, path=str(path))
+    loaded.load()
+    assert loaded.get(key) == {'ok': True}
+    path.unlink()
+    loaded.save()
+    assert not path.exists()
+    loaded.put(key, {'ok': False})
+    loaded.save()
+    assert path.exists()
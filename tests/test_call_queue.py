@@ -0,0 +1,80 @@
+import logging
+import threading
+import time
+
+import pytest
+
+import app
+
+logging.disable(logging.CRITICAL)
+
+class FakeOrg:
+    def __init__(self, name, max_concurrent_requests):
+        self.name = name
+        self.max_concurrent_requests = max_concurrent_requests
+
+class FakeCall:
+    def __init__(self, org, location_id, release):
+        self.org = org
+        self.location_id = location_id
+        self.endpoint = app.get_sensors
+        self.params = {}
+        self.release = release
+        self.ran = False
+
+    def run(self):
+        self.ran = True
+        self.release.wait()
+        return True
+
+@pytest.fixture(autouse=True)
+def running_calls(monkeypatch):
+    monkeypatch.setattr(app, 'RUNNING_BY_ORG', {})
+    monkeypatch.setattr(app, 'RUNNING_BY_LOCATION', {})
+
+def plan_of(calls):
+    plan = app.RequestPlan('test')
+    plan.calls = {index: call for index, call in enumerate(calls)}
+    return plan
+
+def test_call_queue_respects_budgets_and_alternates_orgs(monkeypatch):
+    monkeypatch.setattr(app, 'MAX_REQUESTS_PER_LOCATION', 2)
+    big, small = FakeOrg('big', 10), FakeOrg('small', 1)
+    calls = [app.PlannedCall(big, location_id, app.get_sensors, {'n': n}) for location_id in (1, 2) for n in range(3)]
+    calls += [app.PlannedCall(small, 3, app.get_sensors, {'n': n}) for n in range(3)]
+    queue = app.CallQueue(calls)
+    started = []
+    while True:
+        call = queue.next()
+        if call is None:
+            break
+        started.append((call.org.name, call.location_id))
+    # small runs one call at a time, each big location two at a time.
+    assert started[:3] == [('big', 1), ('small', 3), ('big', 2)]
+    assert started.count(('small', 3)) == 1
+    assert started.count(('big', 1)) == 2 and started.count(('big', 2)) == 2
+    assert len(queue) == 4
+    queue.finished(next(call for call in calls if call.org is small))
+    assert queue.next().org is small
+
+def test_plan_cancels_unstarted_calls_and_leftovers_keep_their_slots(monkeypatch):
+    monkeypatch.setattr(app, 'MAX_REQUESTS_PER_LOCATION', 1)
+    release = threading.Event()
+    org = FakeOrg('org', 1)
+    calls = [FakeCall(org, 1, release), FakeCall(org, 1, release)]
+    try:
+        assert plan_of(calls).run(time.monotonic() + 0.2) == (0, 0, 2, 0)
+        assert calls[0].ran and not calls[1].ran
+        # The first call is still running, so the next pass can't start another
+        # call for the organization until it returns.
+        assert app.RUNNING_BY_ORG == {'org': 1}
+        later = FakeCall(org, 1, release)
+        assert plan_of([later]).run(time.monotonic() + 0.2) == (0, 0, 1, 0)
+        assert not later.ran
+    finally:
+        release.set()
+    deadline = time.monotonic() + 2
+    while app.RUNNING_BY_ORG['org'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert app.RUNNING_BY_ORG == {'org': 0}
+    assert plan_of([FakeCall(org, 1, release)]).run(time.monotonic() + 2) == (1, 0, 0, 0)
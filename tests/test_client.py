@@ -0,0 +1,66 @@
+import logging
+
+import pytest
+import requests
+
+import app
+from mock_wyebot_api import MockWyebotAPI, SyntheticFleet
+
+logging.disable(logging.CRITICAL)
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(app.time, 'sleep', slept.append)
+    return slept
+
+def failing_api(**kwargs):
+    return MockWyebotAPI(SyntheticFleet(locations=1, sensors_per_location=1), api_key='k', **kwargs).start()
+
+def test_server_errors_are_retried_with_jittered_backoff(sleeps):
+    api = failing_api(error_rate=1.0)
+    try:
+        client = app.WyebotClient('retries', api.base_url, 'k', max_retries=3, backoff=0.5, backoff_max=1.5)
+        with pytest.raises(requests.HTTPError):
+            app.get_locations(client)
+        assert api.calls['/org/get_locations'] == 4
+    finally:
+        api.stop()
+    assert len(sleeps) == 3
+    assert all(0 <= delay <= limit for delay, limit in zip(sleeps, (0.5, 1.0, 1.5)))
+
+def test_throttled_requests_wait_for_retry_after(sleeps):
+    api = failing_api(throttle_rate=1.0)
+    try:
+        client = app.WyebotClient('throttled', api.base_url, 'k', max_retries=2)
+        with pytest.raises(requests.HTTPError):
+            app.get_locations(client)
+    finally:
+        api.stop()
+    # The mock answers 429 with Retry-After: 1.
+    assert sleeps == [1.0, 1.0]
+    assert client.throttles() == 3
+
+def test_client_errors_are_not_retried(sleeps):
+    api = failing_api()
+    try:
+        client = app.WyebotClient('unauthorized', api.base_url, 'wrong')
+        with pytest.raises(requests.HTTPError):
+            app.get_locations(client)
+        assert api.calls['/org/get_locations'] == 1
+    finally:
+        api.stop()
+    assert sleeps == []
+
+def test_retry_after_is_capped_and_ignores_dates():
+    client = app.WyebotClient('headers', 'http://wyebot.invalid', 'k', backoff_max=30)
+    response = requests.Response()
+    for value, expected in (('5', 5.0), ('600', 30), ('-1', 0), ('Wed, 21 Oct 2015 07:28:00 GMT', None)):
+        response.headers['Retry-After'] = value
+        assert client.retry_after(response) == expected
+
+def test_backoff_delay_is_jittered_below_the_cap():
+    client = app.WyebotClient('jitter', 'http://wyebot.invalid', 'k', backoff=1, backoff_max=4)
+    delays = [client.backoff_delay(attempt) for attempt in range(6) for _ in range(20)]
+    assert all(0 <= delay <= 4 for delay in delays)
+    assert len(set(delays)) == len(delays)
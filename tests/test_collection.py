@@ -0,0 +1,54 @@
+import logging
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+
+import app
+from mock_wyebot_api import MockWyebotAPI, SyntheticFleet
+
+logging.disable(logging.CRITICAL)
+
+def organization(name, base_url):
+    return app.Organization(name, base_url, 'k', cache_file='', test_results_state_file='')
+
+def wait_for_running_calls():
+    deadline = time.monotonic() + 5
+    while any(app.RUNNING_BY_ORG.values()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+@pytest.fixture
+def fleet():
+    return SyntheticFleet(locations=3, sensors_per_location=3, clients_per_sensor=2)
+
+def run_pass(monkeypatch, api, name):
+    monkeypatch.setattr(app, 'ORGS', [organization(name, api.base_url)])
+    started = time.monotonic()
+    try:
+        app.collect_metrics()
+        return time.monotonic() - started
+    finally:
+        wait_for_running_calls()
+
+def test_pass_collects_every_location(monkeypatch, fleet):
+    api = MockWyebotAPI(fleet, api_key='k').start()
+    try:
+        run_pass(monkeypatch, api, 'complete')
+    finally:
+        api.stop()
+    assert REGISTRY.get_sample_value('wyebot_pass_api_calls', {'result': 'skipped'}) == 0
+    assert REGISTRY.get_sample_value('wyebot_pass_api_calls', {'result': 'failed'}) == 0
+    assert app.WYEBOT_REGISTRY.get_sample_value('wyebot_location_count', {'org': 'complete'}) == 3
+    for location in fleet.locations:
+        labels = {'org': 'complete', 'location_id': str(location['location_id']), 'location_name': location['location_name']}
+        assert app.WYEBOT_REGISTRY.get_sample_value('wyebot_sensor_count', labels) == 3
+
+def test_pass_stops_at_the_deadline(monkeypatch, fleet):
+    monkeypatch.setattr(app, 'PASS_DEADLINE_SECONDS', 0.5)
+    api = MockWyebotAPI(fleet, latency_ms=200, api_key='k').start()
+    try:
+        # The pass returns at the deadline instead of waiting for calls in flight.
+        assert run_pass(monkeypatch, api, 'deadline') < 1.5
+        assert REGISTRY.get_sample_value('wyebot_pass_api_calls', {'result': 'skipped'}) > 0
+    finally:
+        api.stop()
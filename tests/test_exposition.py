@@ -0,0 +1,119 @@
+import gzip
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+from prometheus_client import CollectorRegistry, Counter, Gauge, Info, generate_latest
+from prometheus_client.openmetrics.exposition import generate_latest as generate_openmetrics
+
+import app
+
+@pytest.fixture
+def families():
+    registry = CollectorRegistry()
+    Gauge('alpha', 'Alpha', ['x'], registry=registry).labels('1').set(1)
+    Counter('beta', 'Beta', registry=registry).inc(2)
+    Info('gamma', 'Gamma', registry=registry).info({'k': 'v'})
+    return registry, list(registry.collect())
+
+def test_rendering_matches_generate_latest(families):
+    registry, collected = families
+    rendering = app.Rendering(collected)
+    assert rendering.body == generate_latest(registry)
+    assert gzip.decompress(rendering.gzipped) == rendering.body
+    openmetrics = app.Rendering(collected, openmetrics=True)
+    assert openmetrics.body == generate_openmetrics(registry)
+
+def test_rendering_select_slices_whole_families(families):
+    registry, collected = families
+    rendering = app.Rendering(collected)
+    expected = generate_latest(app.Families([family for family in collected if family.name in ('alpha', 'gamma')]))
+    assert rendering.select(['gamma_info', 'alpha', 'missing']) == expected
+    assert rendering.select(['beta_total']) == generate_latest(app.Families([collected[1]]))
+    assert rendering.select(['missing']) == b''
+
+def test_rendering_select_keeps_one_openmetrics_eof(families):
+    _, collected = families
+    selected = app.Rendering(collected, openmetrics=True).select(['beta', 'alpha'])
+    assert selected.startswith(b'# HELP alpha')
+    assert selected.count(b'# EOF') == 1 and selected.endswith(b'# EOF\n')
+
+@pytest.fixture(scope='module')
+def server():
+    app.SERIES.context.org = app.ORGS[0].name
+    app.set_gauge(app.LOCATION_COUNT, 3)
+    app.EXPOSITION.refresh()
+    server = app.start_metrics_server(0)
+    yield f"http://127.0.0.1:{server.server_address[1]}/metrics"
+    server.shutdown()
+
+def scrape(url, query='', **headers):
+    try:
+        with urlopen(Request(url + query, headers=headers)) as response:
+            return response.status, response.headers, response.read()
+    except HTTPError as e:
+        return e.code, e.headers, b''
+
+def test_self_metrics_are_live_between_passes(server):
+    in_flight = app.API_IN_FLIGHT.labels(org='live-test')
+    in_flight.inc(5)
+    try:
+        _, _, body = scrape(server)
+    finally:
+        in_flight.dec(5)
+    assert b'wyebot_api_requests_in_flight{org="live-test"} 5.0' in body
+    assert b'wyebot_location_count{org="default"} 3.0' in body
+
+def test_gzip_is_the_same_payload(server):
+    _, headers, body = scrape(server)
+    _, gzip_headers, gzipped = scrape(server, **{'Accept-Encoding': 'gzip'})
+    assert gzip_headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(gzipped).split(b'\n')[-30:] == body.split(b'\n')[-30:]
+
+def test_unchanged_filtered_payload_gets_304(server):
+    query = '?name[]=wyebot_location_count'
+    status, headers, body = scrape(server, query)
+    assert status == 200
+    assert body.startswith(b'# HELP wyebot_location_count ')
+    assert scrape(server, query, **{'If-None-Match': headers['ETag']})[0] == 304
+    assert scrape(server, query, **{'If-None-Match': 'W/"other"'})[0] == 200
+
+def test_etag_follows_the_last_pass(server):
+    query = '?name[]=wyebot_location_count'
+    _, headers, _ = scrape(server, query)
+    app.SERIES.context.org = app.ORGS[0].name
+    app.set_gauge(app.LOCATION_COUNT, 4)
+    app.EXPOSITION.refresh()
+    try:
+        status, changed, body = scrape(server, query, **{'If-None-Match': headers['ETag']})
+    finally:
+        app.set_gauge(app.LOCATION_COUNT, 3)
+        app.EXPOSITION.refresh()
+    assert status == 200 and changed['ETag'] != headers['ETag']
+    assert b'wyebot_location_count{org="default"} 4.0' in body
+    assert scrape(server, query)[1]['ETag'] == headers['ETag']
+
+def test_filtered_payload_is_gzipped(server):
+    query = '?name[]=wyebot_location_count'
+    _, _, body = scrape(server, query)
+    _, headers, gzipped = scrape(server, query, **{'Accept-Encoding': 'gzip'})
+    assert headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(gzipped) == body
+
+def test_openmetrics_negotiation(server):
+    status, headers, body = scrape(server, Accept='application/openmetrics-text;version=1.0.0,text/plain;q=0.5')
+    assert headers['Content-Type'].startswith('application/openmetrics-text')
+    assert body.count(b'# EOF') == 1 and body.endswith(b'# EOF\n')
+    status, headers, body = scrape(server)
+    assert headers['Content-Type'].startswith('text/plain')
+    assert b'# EOF' not in body
+
+def test_name_filter_covers_live_and_cached_families(server):
+    _, _, body = scrape(server, '?name[]=wyebot_location_count&name[]=wyebot_series_writes_total')
+    lines = body.decode().splitlines()
+    assert 'wyebot_location_count{org="default"} 3.0' in lines
+    assert any(line.startswith('wyebot_series_writes_total ') for line in lines)
+    assert not any(line.startswith('process_') for line in lines)
+
+def test_favicon_is_not_found(server):
+    assert scrape(server.replace('/metrics', '/favicon.ico'))[0] == 404
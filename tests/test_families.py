@@ -0,0 +1,17 @@
+from prometheus_client import CollectorRegistry, Gauge, Info
+
+import app
+
+def test_family_keeps_label_names_after_org():
+    registry = CollectorRegistry()
+    info = app.family(Info, 'things', 'Things', ('location_id', 'name', 'colour'), registry)
+    assert app.FAMILY_LABELS[info] == ('location_id', 'name', 'colour')
+    assert app.label_rows(info, ('1',), [{'name': 'a', 'colour': 'red'}, {'name': 'b'}]) == [('1', 'a', 'red'), ('1', 'b', '')]
+
+def test_set_gauge_orders_labels_by_family():
+    registry = CollectorRegistry()
+    gauge = app.family(Gauge, 'level', 'Level', ('sensor_id', 'radio'), registry)
+    app.SERIES.context.org = 'o'
+    app.SERIES.context.max_age = 0
+    app.set_gauge(gauge, 3, radio='2.4', sensor_id=7)
+    assert registry.get_sample_value('level', {'org': 'o', 'sensor_id': '7', 'radio': '2.4'}) == 3
@@ -0,0 +1,28 @@
+import pytest
+
+import app
+
+@pytest.mark.parametrize('value, expected', [
+    (5, 5.0),
+    (-45.5, -45.5),
+    ('-45 dBm', -45.0),
+    ('866.7 Mbps', 866.7),
+    ('72%', 72.0),
+    ('', None),
+    ('n/a', None),
+    (None, None),
+    (True, None),
+])
+def test_parse_number(value, expected):
+    assert app.parse_number(value) == expected
+
+@pytest.mark.parametrize('value, expected', [
+    ('1 day, 02:03:04', 93784),
+    ('3 days 00:00:01', 259201),
+    ('12:34:56', 45296),
+    (3600, 3600.0),
+    ('90', 90.0),
+    ('never', None),
+])
+def test_parse_duration(value, expected):
+    assert app.parse_duration(value) == expected
@@ -0,0 +1,46 @@
+import logging
+import time
+
+import app
+from mock_wyebot_api import MockWyebotAPI, SyntheticFleet
+
+logging.disable(logging.CRITICAL)
+
+class FakeOrg:
+    def __init__(self, name):
+        self.name = name
+
+def consumer(response, *args):
+    pass
+
+def other_consumer(response, *args):
+    pass
+
+def test_plan_deduplicates_calls_and_counts_saved():
+    org, other = FakeOrg('org'), FakeOrg('other')
+    plan = app.RequestPlan('test')
+    first = plan.add(org, 1, app.get_sensors, {'location_id': 1, 'sensor_id': 2}, consumer, 'a')
+    assert plan.add(org, 1, app.get_sensors, {'sensor_id': 2, 'location_id': 1}, other_consumer, 'a') is first
+    assert plan.add(org, 1, app.get_sensors, {'location_id': 1, 'sensor_id': 2}, consumer, 'a') is first
+    plan.add(org, 1, app.get_sensors, {'location_id': 1, 'sensor_id': 3}, consumer, 'a')
+    plan.add(other, 1, app.get_sensors, {'location_id': 1, 'sensor_id': 2}, consumer, 'a')
+    assert first.consumers == [(consumer, ('a',)), (other_consumer, ('a',))]
+    assert len(plan.calls) == 3
+    assert plan.saved == 2
+
+def test_one_response_is_handed_to_every_consumer():
+    api = MockWyebotAPI(SyntheticFleet(locations=1, sensors_per_location=2), api_key='k').start()
+    try:
+        org = app.Organization('plan', api.base_url, 'k', cache_file='', test_results_state_file='')
+        location_id = api.fleet.locations[0]['location_id']
+        seen = []
+        def record(response, name):
+            seen.append((name, len(response['sensor_details']['data'])))
+        plan = app.RequestPlan('test')
+        plan.add(org, location_id, app.get_sensors, {'location_id': location_id}, record, 'first')
+        plan.add(org, location_id, app.get_sensors, {'location_id': location_id}, record, 'second')
+        assert plan.execute(time.monotonic() + 5) == (1, 0, 0, 0)
+        assert api.calls['/org/get_sensors'] == 1
+    finally:
+        api.stop()
+    assert seen == [('first', 2), ('second', 2)]
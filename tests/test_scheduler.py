@@ -0,0 +1,47 @@
+import logging
+
+import app
+
+logging.disable(logging.CRITICAL)
+
+PATH = app.ENDPOINT_PATHS[app.get_sensor_info]
+
+def scheduler(interval=100, **kwargs):
+    return app.PollScheduler('org', {PATH: interval}, **kwargs)
+
+def test_next_slot_keeps_its_phase_at_least_half_an_interval_out():
+    schedule = scheduler()
+    first = schedule.next_slot(app.get_sensor_info, 1, 100, 1000)
+    assert 1050 <= first < 1150
+    # Later completions land on the same phase grid.
+    assert schedule.next_slot(app.get_sensor_info, 1, 100, first + 3) == first + 100
+    assert (schedule.next_slot(app.get_sensor_info, 2, 100, 1000) - first) % 100 != 0
+
+def test_only_successful_calls_move_their_slot(monkeypatch):
+    schedule = scheduler()
+    monkeypatch.setattr(app.time, 'time', lambda: 1000.0)
+    assert schedule.due(app.get_sensor_info, 1)
+    schedule.complete(app.get_sensor_info, {1}, 0.1, False, False)
+    assert schedule.due(app.get_sensor_info, 1)
+    schedule.complete(app.get_sensor_info, {1}, 0.1, False, True)
+    assert not schedule.due(app.get_sensor_info, 1)
+
+def test_interval_backs_off_while_throttled_and_recovers():
+    schedule = scheduler(max_backoff=4)
+    for expected in (200, 400, 400):
+        schedule.complete(app.get_sensor_info, {1}, 0.1, True, True)
+        schedule.end_pass()
+        assert schedule.interval(app.get_sensor_info) == expected
+    schedule.complete(app.get_sensor_info, {1}, 0.1, False, True)
+    schedule.end_pass()
+    assert schedule.interval(app.get_sensor_info) < 400
+    # Latency well above the baseline stretches the interval too.
+    slow = scheduler()
+    slow.complete(app.get_sensor_info, {1}, 0.1, False, True)
+    slow.end_pass()
+    slow.complete(app.get_sensor_info, {1}, 1.0, False, True)
+    slow.end_pass()
+    assert slow.interval(app.get_sensor_info) == 150
+
+def test_unscheduled_endpoints_are_always_due():
+    assert scheduler().due(app.get_sensors, 1)
@@ -0,0 +1,40 @@
+import logging
+
+from prometheus_client import CollectorRegistry, Gauge
+
+import app
+
+logging.disable(logging.CRITICAL)
+
+def tracked_gauge():
+    registry = CollectorRegistry()
+    return registry, Gauge('tracked', 'Tracked gauge', ['org', 'sensor_id'], registry=registry)
+
+def test_series_evicted_after_stale_passes():
+    registry, gauge = tracked_gauge()
+    tracker = app.SeriesTracker(stale_after=2)
+    tracker.context.org = 'o'
+    tracker.children(gauge, [('1',), ('2',)])[0].set(5)
+    # Passes that don't write sensor 1; its series goes once it has missed more than two.
+    for _ in range(2):
+        tracker.end_pass()
+        tracker.children(gauge, [('2',)])
+    assert registry.get_sample_value('tracked', {'org': 'o', 'sensor_id': '1'}) == 5
+    tracker.end_pass()
+    assert registry.get_sample_value('tracked', {'org': 'o', 'sensor_id': '1'}) is None
+    assert registry.get_sample_value('tracked', {'org': 'o', 'sensor_id': '2'}) == 0
+
+def test_series_kept_until_max_age_expires(monkeypatch):
+    registry, gauge = tracked_gauge()
+    tracker = app.SeriesTracker(stale_after=0)
+    tracker.context.org = 'o'
+    tracker.context.max_age = 100
+    now = 1000.0
+    monkeypatch.setattr(app.time, 'time', lambda: now)
+    tracker.children(gauge, [('1',)])
+    for _ in range(3):
+        tracker.end_pass()
+    assert registry.get_sample_value('tracked', {'org': 'o', 'sensor_id': '1'}) == 0
+    now = 1101.0
+    tracker.end_pass()
+    assert registry.get_sample_value('tracked', {'org': 'o', 'sensor_id': '1'}) is None
@@ -0,0 +1,49 @@
+import logging
+
+import pytest
+from prometheus_client import REGISTRY
+
+import app
+from mock_wyebot_api import MockWyebotAPI, SyntheticFleet
+
+logging.disable(logging.CRITICAL)
+
+ORG = app.ORGS[0]
+SHARD = {'shard_index': str(app.SHARD_INDEX), 'shard_count': str(app.SHARD_COUNT)}
+
+def test_location_shard_is_stable_and_moves_few_locations(monkeypatch):
+    locations = range(2000)
+    monkeypatch.setattr(app, 'SHARD_COUNT', 4)
+    four = [app.location_shard(ORG, location_id) for location_id in locations]
+    assert four == [app.location_shard(ORG, location_id) for location_id in locations]
+    assert set(four) == {0, 1, 2, 3}
+    assert all(300 < four.count(shard) < 700 for shard in range(4))
+    monkeypatch.setattr(app, 'SHARD_COUNT', 5)
+    five = [app.location_shard(ORG, location_id) for location_id in locations]
+    # Only locations that move to the new shard change owner.
+    assert all(new == old or new == 4 for old, new in zip(four, five))
+    assert 300 < five.count(4) < 500
+
+@pytest.fixture
+def mock_api():
+    api = MockWyebotAPI(SyntheticFleet(locations=2, sensors_per_location=2, clients_per_sensor=2), api_key='k').start()
+    yield api
+    api.stop()
+
+def organization(name, base_url):
+    org = app.Organization(name, base_url, 'k', cache_file='', test_results_state_file='')
+    org.client.max_retries = 0
+    return org
+
+def last_success_after_pass(monkeypatch, orgs):
+    monkeypatch.setattr(app, 'ORGS', orgs)
+    app.SHARD_LAST_SUCCESS.labels(**SHARD).set(0)
+    app.collect_metrics()
+    return REGISTRY.get_sample_value('wyebot_shard_last_success_timestamp_seconds', SHARD)
+
+def test_shard_succeeds_when_every_organization_is_listed(monkeypatch, mock_api):
+    assert last_success_after_pass(monkeypatch, [organization('one', mock_api.base_url)]) > 0
+
+def test_shard_fails_when_an_organization_cannot_be_listed(monkeypatch, mock_api):
+    broken = organization('broken', mock_api.base_url.replace('/external_api', '/missing'))
+    assert last_success_after_pass(monkeypatch, [organization('one', mock_api.base_url), broken]) == 0
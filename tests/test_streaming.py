@@ -0,0 +1,49 @@
+import logging
+from types import GeneratorType
+
+import pytest
+from prometheus_client import REGISTRY
+
+import app
+from mock_wyebot_api import MockWyebotAPI, SyntheticFleet, handle_client_distribution, handle_clients
+
+logging.disable(logging.CRITICAL)
+
+def test_project_keeps_listed_and_nested_fields():
+    row = {'ssid': 'a', 'extra': 1, 'bssid_details_array': [{'bssid': 'x', 'noise': 2}], 'other_array': [{'y': 1}]}
+    fields = ('ssid', 'missing', ('bssid_details_array', ('bssid',)), ('absent_array', ('z',)))
+    assert app.project(row, fields) == {'ssid': 'a', 'bssid_details_array': [{'bssid': 'x'}]}
+
+@pytest.fixture(scope='module')
+def streaming():
+    pytest.importorskip('ijson')
+    fleet = SyntheticFleet(locations=1, sensors_per_location=2, clients_per_sensor=50)
+    api = MockWyebotAPI(fleet, api_key='k').start()
+    client = app.WyebotClient('streaming', api.base_url, 'k', projections=app.STREAM_PROJECTIONS)
+    yield fleet, client
+    api.stop()
+
+def test_single_list_is_streamed_as_projected_rows(streaming):
+    fleet, client = streaming
+    location_id = fleet.locations[0]['location_id']
+    response = app.get_client_details(client, location_id=location_id)
+    rows = response['client_details']['data']
+    assert isinstance(rows, GeneratorType)
+    fields = app.STREAM_PROJECTIONS['/dashboard/clientlist'][1]['data']
+    expected = [app.project(row, fields) for row in handle_clients(fleet, {'location_id': str(location_id)})['client_details']['data']]
+    assert list(rows) == expected
+    assert len(expected) == 100
+    labels = {'org': 'streaming', 'endpoint': '/dashboard/clientlist'}
+    assert REGISTRY.get_sample_value('wyebot_api_requests_total', dict(labels, result='success')) == 1
+    assert REGISTRY.get_sample_value('wyebot_api_response_bytes_total', labels) > 0
+
+def test_several_lists_are_collected_while_streaming(streaming):
+    fleet, client = streaming
+    sensor = fleet.locations[0]['sensors'][0]
+    params = {'location_id': str(fleet.locations[0]['location_id']), 'sensor_id': str(sensor['sensor_id'])}
+    response = app.get_client_distribution(client, location_id=params['location_id'], sensor_id=params['sensor_id'])
+    lists = app.STREAM_PROJECTIONS['/dashboard/clientdistributionlist'][1]
+    expected = handle_client_distribution(fleet, params)['client_distribution_list']
+    assert response['client_distribution_list'] == {
+        name: [app.project(row, fields) for row in expected[name]] for name, fields in lists.items()
+    }
@@ -0,0 +1,68 @@
+import logging
+from datetime import datetime
+
+import pytest
+from prometheus_client import CollectorRegistry, Gauge
+
+import app
+
+logging.disable(logging.CRITICAL)
+
+# TestResultWatermarks
+
+def test_watermarks_only_return_new_results():
+    watermarks = app.TestResultWatermarks(path='')
+    results = [
+        {'start_time': '2024-01-01 10:05:00', 'execution_id': 'b'},
+        {'start_time': '2024-01-01 10:00:00', 'execution_id': 'a'},
+    ]
+    assert [r['execution_id'] for r in watermarks.new_results(1, 7, results)] == ['a', 'b']
+    assert watermarks.new_results(1, 7, results) == []
+    # A run reported at the high-water mark with a new execution_id is still new.
+    late = {'start_time': '2024-01-01 10:05:00', 'execution_id': 'c'}
+    assert watermarks.new_results(1, 7, results + [late]) == [late]
+    assert watermarks.new_results(1, 7, results + [late]) == []
+
+def test_watermarks_window_starts_at_mark_or_lookback():
+    watermarks = app.TestResultWatermarks(lookback=3600, path='')
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    assert watermarks.window(1, 7, now) == ('2024-01-01 11:00:00', '2024-01-01 12:00:00')
+    watermarks.new_results(1, 7, [{'start_time': '2024-01-01 11:30:00', 'execution_id': 'a'}])
+    assert watermarks.window(1, 7, now) == ('2024-01-01 11:30:00', '2024-01-01 12:00:00')
+    assert watermarks.window(1, 8, now)[0] == '2024-01-01 11:00:00'
+
+# LastTestResults
+
+def test_last_test_results_survive_until_profile_is_gone():
+    registry = CollectorRegistry()
+    labels = ['org', 'location_id', 'network_test_profile_id', 'sensor_id']
+    results = app.LastTestResults(Gauge('status', 'Status', labels, registry=registry), Gauge('run', 'Run', labels, registry=registry))
+    results.set('o', 1, 5, 7, 2, 1700000000)
+    sample = {'org': 'o', 'location_id': '1', 'network_test_profile_id': '5', 'sensor_id': '7'}
+    results.prune('o', [1], {1: [{'network_test_profile_id': 5}]})
+    results.prune('o', [1], {})
+    assert registry.get_sample_value('status', sample) == 2
+    results.prune('o', [1], {1: []})
+    assert registry.get_sample_value('status', sample) is None
+    assert registry.get_sample_value('run', sample) is None
+
+# State files
+
+@pytest.mark.parametrize('content', ['[]', '{"1:7": 5}', '{"1:7": {"start_time": 5, "execution_ids": []}}'])
+def test_watermarks_ignore_file_of_wrong_shape(tmp_path, content):
+    path = tmp_path / 'marks.json'
+    path.write_text(content)
+    watermarks = app.TestResultWatermarks(path=str(path))
+    watermarks.load()
+    assert watermarks.marks == {}
+
+def test_watermarks_save_only_changes(tmp_path):
+    path = tmp_path / 'marks.json'
+    watermarks = app.TestResultWatermarks(path=str(path))
+    watermarks.save()
+    assert not path.exists()
+    watermarks.new_results(1, 7, [{'start_time': '2024-01-01 10:00:00', 'execution_id': 'a'}])
+    watermarks.save()
+    loaded = app.TestResultWatermarks(path=str(path))
+    loaded.load()
+    assert loaded.marks == watermarks.marks